@@ -5,6 +5,7 @@ import { Link } from 'react-router-dom';
 import Square from '../components/square';
 import {
   to2D,
+  decodeCells,
   getCookie,
   retry,
   request,
@@ -36,17 +37,19 @@ export default function Game({ match }) { // eslint-disable-line react/prop-type
   async function getGame(gameId) {
     setLoading(true);
 
-    const response = await retry(() => request(`/api/games/${gameId}`));
+    const response = await retry(() => request(`/api/games/${gameId}?format=rle`));
 
     const {
       status: gameStatus,
       grid: {
-        squares: gridSquares,
+        cells,
+        encoding,
         mine_count,
         ...dimensions
       },
     } = await response.json();
 
+    const gridSquares = decodeCells(cells, encoding, dimensions.width);
     setSquares(to2D(gridSquares, dimensions.width, dimensions.height));
     setGrid(dimensions);
     setMineCount(mine_count);
@@ -56,15 +59,21 @@ export default function Game({ match }) { // eslint-disable-line react/prop-type
   }
 
   /**
-   * Reveal a square by its ID, recursively revealing any neighbouring squares
-   * with no adjacent mines
+   * Reveal a square by its position, recursively revealing any neighbouring
+   * squares with no adjacent mines. Revealing a square which is already
+   * revealed chords it, revealing its unflagged neighbours if it has as many
+   * flags around it as adjacent mines
    *
-   * @param {number} squareId The ID of the square to reveal
+   * @param {Object} square The square to reveal
+   * @param {number} square.x The position of the square in the x axis
+   * @param {number} square.y The position of the square in the y axis
+   * @param {boolean} square.is_revealed Whether the square is already revealed
    * @returns {Promise} A promise of nothing
    */
-  async function reveal(squareId) {
+  async function reveal({ x, y, is_revealed }) {
+    const action = is_revealed ? 'chord' : 'reveal';
     const response = await retry(() => request(
-      `/api/squares/${squareId}/reveal`, {
+      `/api/games/${id}/cells/${x}/${y}/${action}`, {
         method: 'POST',
         headers: csrfJsonHeaders,
       },
@@ -87,11 +96,17 @@ export default function Game({ match }) { // eslint-disable-line react/prop-type
       setMineCount(mine_count);
       setStatus(game_status);
     } else {
-      const { unflagged_mines, incorrect_flags } = data;
+      const { revealed, unflagged_mines, incorrect_flags } = data;
       setStatus('L');
       setSquares((sqs) => {
         const newSquares = Array.from(sqs);
 
+        // a chord can reveal safe squares along with the mine
+        revealed.forEach(({ x, y, adjacent_mines }) => {
+          newSquares[y][x].adjacent_mines = adjacent_mines;
+          newSquares[y][x].is_revealed = true;
+        });
+
         unflagged_mines.forEach((mine) => {
           newSquares[mine.y][mine.x].is_revealed = true;
           newSquares[mine.y][mine.x].has_mine = true;
@@ -108,18 +123,17 @@ export default function Game({ match }) { // eslint-disable-line react/prop-type
   /**
    * Add or remove the flag from a square
    *
-   * @param {number} squareId The ID of the square to toggle the flag on
-   * @param {Object} square The square object itself
+   * @param {Object} square The square to toggle the flag on
    * @param {number} square.x The position of the square in the x axis
    * @param {number} square.y The position of the square in the y axis
    * @param {boolean} square.has_flag Whether the square already has a flag
    * @returns {Promise} A promise of nothing
    */
-  async function flag(squareId, square) {
+  async function flag(square) {
     const { x, y, has_flag } = square;
 
     const response = await retry(() => request(
-      `/api/squares/${squareId}/flag`, {
+      `/api/games/${id}/cells/${x}/${y}/flag`, {
         method: has_flag ? 'DELETE' : 'POST',
         headers: csrfJsonHeaders,
       },
@@ -135,10 +149,47 @@ export default function Game({ match }) { // eslint-disable-line react/prop-type
     });
   }
 
+  /**
+   * Apply the squares changed by moves made by anyone playing the game, as
+   * sent over the live updates socket
+   *
+   * @param {Object} diff The changes, like a response to ?since=<version>
+   * @param {string} diff.status The status of the game
+   * @param {Object} diff.grid The changed squares and the mine count
+   * @returns {undefined}
+   */
+  function applyDiff({ status: gameStatus, grid: { squares: changed, mine_count } }) {
+    setSquares((sqs) => {
+      const newSquares = Array.from(sqs);
+      changed.forEach((square) => {
+        const row = newSquares[square.y];
+        if (row) {
+          row[square.x] = { ...square, is_incorrect: row[square.x].is_incorrect };
+        }
+      });
+      return newSquares;
+    });
+
+    setMineCount(mine_count);
+    setStatus(gameStatus);
+  }
+
   // When the component renders for the first time, get the gamestate from the
-  // server
+  // server, and then keep up with moves made by anyone else playing
   useEffect(() => {
     getGame(id);
+
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const socket = new WebSocket(`${protocol}//${window.location.host}/ws/games/${id}`);
+    socket.onmessage = ({ data }) => {
+      const diff = JSON.parse(data);
+      // the first message only has the version
+      if (diff.grid) {
+        applyDiff(diff);
+      }
+    };
+
+    return () => socket.close();
   }, []);
 
   return (
@@ -180,13 +231,13 @@ export default function Game({ match }) { // eslint-disable-line react/prop-type
             {squares.map(row => (
               row.map(square => (
                 <Square
-                  key={square.id}
+                  key={`${square.x}-${square.y}`}
                   square={square}
                   disabled={status === 'L' || status === 'W'}
-                  onClick={() => reveal(square.id)}
+                  onClick={() => reveal(square)}
                   onContextMenu={(e) => {
                     e.preventDefault();
-                    flag(square.id, square);
+                    flag(square);
                   }}
                 />
               ))
@@ -37,6 +37,54 @@ export function to2D(squares, width, height) {
   return grid;
 }
 
+/**
+ * Expand runs shortened by the server's run-length encoding, e.g. '.{3}F'
+ * becomes '...F'
+ *
+ * @param {string} text The run-length encoded string
+ * @returns {string}
+ */
+export function runLengthDecode(text) {
+  return text.replace(/(.)\{(\d+)\}/g, (match, character, length) => (
+    character.repeat(Number(length))
+  ));
+}
+
+/* eslint-disable camelcase */
+
+/**
+ * Convert the compact string of cells sent by the server (with a character
+ * per square in row-major order) into a 1D array of square objects, which
+ * can be passed to to2D
+ *
+ * @param {string} cells The cells of the board
+ * @param {string} encoding How the cells were encoded ('packed' or 'rle')
+ * @param {number} width The width of the board
+ * @returns {Object[]}
+ */
+export function decodeCells(cells, encoding, width) {
+  const characters = encoding === 'rle' ? runLengthDecode(cells) : cells;
+
+  return Array.from(characters, (character, index) => {
+    const square = {
+      x: index % width,
+      y: Math.floor(index / width),
+      is_revealed: character !== '.' && character !== 'F',
+    };
+
+    if (square.is_revealed) {
+      square.has_mine = character === 'M';
+      square.adjacent_mines = square.has_mine ? 0 : parseInt(character, 16);
+    } else {
+      square.has_flag = character === 'F';
+    }
+
+    return square;
+  });
+}
+
+/* eslint-enable camelcase */
+
 const severity = {
   1: 'blue',
   2: 'green',
@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save
 
 
 class GamesConfig(AppConfig):
     name = 'games'
+
+    def ready(self):
+        # send every move to the players and spectators watching the game
+        from .cache import forget_new_game, games_cache
+        from .live import publish_move
+        from .models import Game
+
+        games_cache.listeners.append(publish_move)
+
+        # IDs can be used again by a new database, so don't let a new game
+        # pick up an old one from the shared store
+        post_save.connect(forget_new_game, sender=Game)
+
+        # tune every SQLite connection for several workers
+        from .database import configure_connection
+
+        connection_created.connect(configure_connection)
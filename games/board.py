@@ -0,0 +1,374 @@
+"""
+A compact, packed representation of a minesweeper board
+
+Each cell is stored as a single byte in row-major order:
+
+    bit 0       the cell has a mine
+    bit 1       the cell has a flag
+    bit 2       the cell has been revealed
+    bits 4-7    the number of adjacent mines
+"""
+import random
+
+MINE = 0x01
+FLAG = 0x02
+REVEALED = 0x04
+
+ADJACENT_SHIFT = 4
+
+def _visible_character(cell):
+    """
+    Get the character that a cell is shown as in `Board.to_string`
+    """
+    if cell & REVEALED:
+        return 'M' if cell & MINE else '{:x}'.format(cell >> ADJACENT_SHIFT)
+    return 'F' if cell & FLAG else '.'
+
+# what the player can see of every possible cell value
+VISIBLE_CHARACTERS = bytes(ord(_visible_character(cell)) for cell in range(256))
+
+# a 1 for every cell value with a mine, and 0 otherwise
+MINE_LAYOUT = bytes(cell & MINE for cell in range(256))
+
+
+class Board:
+    """
+    A grid of cells backed by a bytearray, one byte per cell
+    """
+
+    def __init__(self, width, height, cells=None):
+        self.width = width
+        self.height = height
+        if cells:
+            self.cells = bytearray(cells)
+        else:
+            self.cells = bytearray(width * height)
+
+        if len(self.cells) != width * height:
+            raise ValueError('Board data does not match its dimensions')
+
+    def __len__(self):
+        return len(self.cells)
+
+    def index(self, x, y):
+        """
+        Get the index of the cell at (x, y)
+        """
+        return y * self.width + x
+
+    def coords(self, index):
+        """
+        Get the (x, y) position of the cell at the given index
+        """
+        y, x = divmod(index, self.width)
+        return x, y
+
+    def contains(self, x, y):
+        """
+        Check if (x, y) is a position on the board
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def has_mine(self, index):
+        """
+        Check if the cell at the given index has a mine
+        """
+        return bool(self.cells[index] & MINE)
+
+    def has_flag(self, index):
+        """
+        Check if the cell at the given index has a flag
+        """
+        return bool(self.cells[index] & FLAG)
+
+    def is_revealed(self, index):
+        """
+        Check if the cell at the given index has been revealed
+        """
+        return bool(self.cells[index] & REVEALED)
+
+    def adjacent_mines(self, index):
+        """
+        Get the number of mines adjacent to the cell at the given index
+        """
+        return self.cells[index] >> ADJACENT_SHIFT
+
+    def set_flag(self, index, value):
+        """
+        Add or remove the flag on the cell at the given index. Flags can't be
+        changed on revealed cells. Returns whether the flag changed
+        """
+        if self.is_revealed(index) or self.has_flag(index) == bool(value):
+            return False
+        if value:
+            self.cells[index] |= FLAG
+        else:
+            self.cells[index] &= ~FLAG
+        return True
+
+    def _neighbour_offsets(self):
+        """
+        Get the index offsets to the neighbours of a cell for cells in the
+        first column, the last column, and every other column respectively.
+        Offsets which land above or below the board are filtered by the caller
+        """
+        if getattr(self, '_offsets', None) is None:
+            width = self.width
+            def offsets(min_dx, max_dx):
+                return tuple(
+                    dy * width + dx
+                    for dy in (-1, 0, 1)
+                    for dx in range(min_dx, max_dx + 1)
+                    if dx or dy
+                )
+            self._offsets = (
+                offsets(0, 1 if width > 1 else 0),
+                offsets(-1 if width > 1 else 0, 0),
+                offsets(-1, 1),
+            )
+        return self._offsets
+
+    def _offsets_for(self, index):
+        """
+        Get the neighbour offsets that apply to the cell at the given index
+        """
+        first, last, middle = self._neighbour_offsets()
+        x = index % self.width
+        if x == 0:
+            return first
+        if x == self.width - 1:
+            return last
+        return middle
+
+    def neighbours(self, index):
+        """
+        Get the indices of the (up to 8) cells around the given index
+        """
+        size = len(self.cells)
+        return [
+            index + offset
+            for offset in self._offsets_for(index)
+            if 0 <= index + offset < size
+        ]
+
+    def place_mines(self, mines):
+        """
+        Set the mine layout from a bytes-like object with a 1 for every cell
+        that has a mine and a 0 otherwise (in row-major order), and calculate
+        the number of adjacent mines for every cell. Flags and revealed cells
+        are kept
+
+        The counts are calculated for the whole board at once by treating
+        the layout as one big integer with a byte per cell, so that shifting
+        it by one byte or by a row lines every cell up with a neighbour. No
+        count can exceed 9, so adding the shifted copies never carries into
+        the next cell
+        """
+        width, size = self.width, len(self.cells)
+        if len(mines) != size:
+            raise ValueError('Mine layout does not match the board dimensions')
+
+        layout = int.from_bytes(mines, 'little')
+        not_first_column = int.from_bytes(
+            (b'\x00' + b'\xff' * (width - 1)) * self.height, 'little',
+        )
+        not_last_column = int.from_bytes(
+            (b'\xff' * (width - 1) + b'\x00') * self.height, 'little',
+        )
+
+        # each cell plus its left and right neighbours, then plus the rows
+        # above and below that, minus the cell itself
+        rows = layout + ((layout << 8) & not_first_column) + ((layout >> 8) & not_last_column)
+        boxes = rows + (rows << 8 * width) + (rows >> 8 * width)
+        boxes &= (1 << 8 * size) - 1
+        counts = boxes - layout
+
+        state = int.from_bytes(self.cells, 'little') & int.from_bytes(
+            bytes([FLAG | REVEALED]) * size, 'little',
+        )
+        self.cells = bytearray(
+            ((counts << ADJACENT_SHIFT) | layout | state).to_bytes(size, 'little'),
+        )
+
+    def mine_layout(self):
+        """
+        Get the layout of the mines, as taken by `place_mines`
+        """
+        return self.cells.translate(MINE_LAYOUT)
+
+    def place_random_mines(self, mine_chance, rng=random, safe=()):
+        """
+        Place mines so that each cell has one with a probability of
+        `mine_chance`, except for the cells at the indices in `safe`. The
+        layout is drawn from `rng` (a `random.Random` or the `random` module)
+        in one call, one random byte per cell
+        """
+        size = len(self.cells)
+        threshold = min(max(round(mine_chance * 256), 0), 256)
+        to_mines = bytes(1 if value < threshold else 0 for value in range(256))
+
+        noise = rng.getrandbits(8 * size).to_bytes(size, 'little')
+        mines = bytearray(noise.translate(to_mines))
+        for index in safe:
+            mines[index] = 0
+        self.place_mines(mines)
+
+    @classmethod
+    def generate(cls, width, height, mine_chance, rng=random):
+        """
+        Make a new board where each cell has a mine with a probability of
+        `mine_chance`. See `place_random_mines`
+        """
+        board = cls(width, height)
+        board.place_random_mines(mine_chance, rng)
+        return board
+
+    def reveal(self, *indices):
+        """
+        Reveal the cells at the given indices, and recursively any blank cells
+        around them. Returns the indices of all of the newly revealed cells
+
+        The revealed bit doubles as the visited marker, so every cell is
+        queued at most once and the work done is proportional to the number
+        of cells revealed, however many cells the fill starts from
+        """
+        cells = self.cells
+        size = len(cells)
+        offsets_for = self._offsets_for
+
+        revealed = []
+        for index in indices:
+            if not cells[index] & REVEALED:
+                cells[index] |= REVEALED
+                revealed.append(index)
+
+        # maintain a queue of cells to avoid actual recursion
+        queue = list(revealed)
+        while queue:
+            current = queue.pop()
+
+            # if this isn't a blank cell, we shouldn't reveal its neighbours
+            if cells[current] & MINE or cells[current] >> ADJACENT_SHIFT:
+                continue
+
+            for offset in offsets_for(current):
+                adjacent = current + offset
+                if not 0 <= adjacent < size or cells[adjacent] & (MINE | REVEALED):
+                    continue
+                cells[adjacent] |= REVEALED
+                revealed.append(adjacent)
+                queue.append(adjacent)
+
+        return revealed
+
+    def chord_targets(self, index):
+        """
+        Get the cells which chording on the cell at the given index would
+        reveal: its hidden, unflagged neighbours, if it is a revealed number
+        with exactly that many flags around it. Otherwise there are none
+        """
+        if not self.is_revealed(index) or not self.adjacent_mines(index):
+            return []
+
+        # cells revealed by a flood fill can still have a flag, which doesn't
+        # count towards the number
+        neighbours = self.neighbours(index)
+        flags = sum(
+            1 for adjacent in neighbours
+            if self.cells[adjacent] & (FLAG | REVEALED) == FLAG
+        )
+        if flags != self.adjacent_mines(index):
+            return []
+        return [
+            adjacent for adjacent in neighbours
+            if not self.cells[adjacent] & (FLAG | REVEALED)
+        ]
+
+    def reveal_mines(self):
+        """
+        Reveal every mine without a flag, and find every incorrect flag. Used
+        when the game is lost. Returns a tuple of (unflagged_mines,
+        incorrect_flags) indices
+        """
+        unflagged_mines = []
+        incorrect_flags = []
+        for index, cell in enumerate(self.cells):
+            if cell & MINE and not cell & FLAG:
+                self.cells[index] |= REVEALED
+                unflagged_mines.append(index)
+            elif cell & FLAG and not cell & MINE:
+                incorrect_flags.append(index)
+        return unflagged_mines, incorrect_flags
+
+    def _count(self, predicate):
+        """
+        Count the cells for which `predicate(cell)` is true, by mapping every
+        possible cell value through it once rather than calling it per cell
+        """
+        table = bytes(1 if predicate(value) else 0 for value in range(256))
+        return self.cells.translate(table).count(1)
+
+    def mine_total(self):
+        """
+        Get the number of mines on the board
+        """
+        return self._count(lambda cell: cell & MINE)
+
+    def flag_total(self):
+        """
+        Get the number of flags on cells which haven't been revealed
+        """
+        return self._count(lambda cell: cell & (FLAG | REVEALED) == FLAG)
+
+    def hidden_safe_total(self):
+        """
+        Get the number of cells without mines which are not yet revealed
+        """
+        return self._count(lambda cell: not cell & (MINE | REVEALED))
+
+    def to_string(self):
+        """
+        Get what the player can see of the board as a string with a character
+        per cell in row-major order: '.' for hidden cells, 'F' for flagged
+        cells, 'M' for revealed mines, and the number of adjacent mines for
+        other revealed cells
+        """
+        return self.cells.translate(VISIBLE_CHARACTERS).decode('ascii')
+
+    def row_to_string(self, y):
+        """
+        Get one row of the output of `to_string`
+        """
+        row = self.cells[y * self.width:(y + 1) * self.width]
+        return row.translate(VISIBLE_CHARACTERS).decode('ascii')
+
+    def region_to_string(self, x0, y0, x1, y1):
+        """
+        Get the part of the output of `to_string` for the cells with
+        x0 <= x < x1 and y0 <= y < y1, sliced a row at a time
+        """
+        width = self.width
+        return b''.join(
+            self.cells[y * width + x0:y * width + x1] for y in range(y0, y1)
+        ).translate(VISIBLE_CHARACTERS).decode('ascii')
+
+    def cell_data(self, index):
+        """
+        Get the fields of a cell that should be sent to the client
+        """
+        cell = self.cells[index]
+        x, y = self.coords(index)
+        data = {
+            'x': x,
+            'y': y,
+            'is_revealed': bool(cell & REVEALED),
+        }
+
+        # add adjacent_mines/has_flag only if relevant
+        if cell & REVEALED:
+            data['has_mine'] = bool(cell & MINE)
+            data['adjacent_mines'] = cell >> ADJACENT_SHIFT
+        else:
+            data['has_flag'] = bool(cell & FLAG)
+
+        return data
@@ -0,0 +1,466 @@
+"""
+An in-process cache of the games being played, so that moves don't have to
+reload the game from the database every time
+"""
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Game
+from .stores import TOMBSTONE, database_namespace, get_store
+
+logger = logging.getLogger(__name__)
+
+class MoveConflict(Exception):
+    """
+    Raised when a move can't be kept because another worker made a move on
+    the same game first. Making the move again will use the newer game
+    """
+
+
+class GameLocks:
+    """
+    A lock for each game, so that moves on the same game take turns without
+    holding up moves on other games. A game's lock only exists while it is
+    held or waited for
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, game_id, blocking):
+        """
+        Acquire the lock for a game, returning whether it was acquired
+        """
+        with self._lock:
+            entry = self._locks.get(game_id)
+            if entry is None:
+                entry = self._locks[game_id] = [threading.Lock(), 0]
+            entry[1] += 1
+
+        if entry[0].acquire(blocking):
+            return True
+        self._forget(game_id, entry)
+        return False
+
+    def _forget(self, game_id, entry):
+        """
+        Stop waiting for or holding the lock for a game
+        """
+        with self._lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[game_id]
+
+    def release(self, game_id):
+        """
+        Release the lock for a game
+        """
+        entry = self._locks[game_id]
+        entry[0].release()
+        self._forget(game_id, entry)
+
+    def try_acquire(self, game_id):
+        """
+        Acquire the lock for a game if no one else holds it, returning whether
+        it was acquired
+        """
+        return self._acquire(game_id, False)
+
+    @contextmanager
+    def hold(self, game_id):
+        """
+        Hold the lock for a game for the duration of the block
+        """
+        self._acquire(game_id, True)
+        try:
+            yield
+        finally:
+            self.release(game_id)
+
+
+class GameCache:
+    """
+    A least-recently-used cache of games with their boards loaded, keyed by
+    game ID. Its size is bounded by the total number of squares of the cached
+    games.
+
+    Moves are applied to the cached game, and the changes are written back to
+    the database by a background thread every `flush_interval` seconds (or
+    immediately if it is 0). Games that are evicted or finished are written
+    back straight away.
+
+    Moves on the same game take turns, using a lock for each game in `locks`,
+    while moves on other games go ahead at the same time. The lock for the
+    whole cache is only held to look games up and keep count of them, and
+    is always taken after a game's lock, never before. Games are loaded from
+    the store or the database with only their own lock held, and `get` gives
+    out copies, so a game is never seen halfway through a move.
+
+    If there is a shared `store` (see `games.stores`), every move is also
+    published to it with the new version of the game. Before a cached game is
+    used, its version is checked against the store, so that a move made by
+    another worker is never missed. The move is only published if the store
+    still has the version it was made on, so if another worker made a move
+    on the game first, MoveConflict is raised and the move is thrown away.
+    Games loaded from the database are added to the store, so a game which
+    is missing from it has been invalidated and is loaded again. When a game
+    is deleted from the database, `remove` leaves a tombstone in the store,
+    so that every worker stops using its copy.
+
+    After every move, each of `listeners` is called with the game and the
+    version it had before the move
+    """
+
+    def __init__(self, max_squares, flush_interval, store=None):
+        self.max_squares = max_squares
+        self.flush_interval = flush_interval
+        self.store = store
+
+        self._games = OrderedDict()
+        self._dirty = set()
+        self._squares = 0
+        self._lock = threading.RLock()
+        self._flusher = None
+        self.locks = GameLocks()
+        self.listeners = []
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.shared_hits = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.conflicts = 0
+
+    def _load(self, game_id):
+        """
+        Get a game from the cache, loading it from the shared store or the
+        database if needed. Raises Game.DoesNotExist if there is no such game.
+        The game's lock must be held, and the cache lock is only taken to look
+        the game up and to add it, so that loading one game doesn't hold up
+        the others
+        """
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is not None:
+                self._games.move_to_end(game_id)
+                if self.store is None:
+                    self.hits += 1
+                    return game
+
+        if game is not None:
+            shared_version = self.store.version(game_id)
+            if shared_version is not None and shared_version <= game.version:
+                with self._lock:
+                    self.hits += 1
+                return game
+
+        try:
+            game = self._fetch(game_id)
+        except Game.DoesNotExist:
+            with self._lock:
+                self._discard(game_id)
+            raise
+
+        with self._lock:
+            if game_id in self._games:
+                # another worker has made a move since this copy was cached,
+                # or the game has been invalidated or removed
+                self.stale += 1
+            else:
+                self.misses += 1
+            self._put(game)
+        return game
+
+    @staticmethod
+    def _copy(game):
+        """
+        Copy a game, including the moves and snapshots which haven't been
+        saved yet
+        """
+        copy = Game.from_state(game.dump_state())
+        copy.pending_snapshots.extend(game.pending_snapshots)
+        return copy
+
+    def _put(self, game):
+        """
+        Add a game to the cache in place of any copy of it which is there,
+        keeping track of whether it has unsaved changes
+        """
+        self._discard(game.id, keep_dirty=True)
+        self._games[game.id] = game
+        self._squares += len(game.grid.board)
+
+    def _fetch(self, game_id):
+        """
+        Get the newest version of a game from the shared store if it has it,
+        or from the database otherwise
+        """
+        if self.store is not None:
+            shared = self.store.get(game_id)
+            if shared is not None and shared[0] == TOMBSTONE:
+                raise Game.DoesNotExist()
+            if shared is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                return Game.from_state(shared[1])
+
+        game = Game.objects.select_related('grid').get(pk=game_id)
+        if self.store is not None:
+            self.store.set(game.id, game.version, game.dump_state())
+        return game
+
+    def _evict(self):
+        """
+        Remove the least recently used games until the cache fits, keeping at
+        least the most recent one. The games to remove are picked with the
+        cache lock held, but they are saved after releasing it, so lookups
+        don't wait on the database. Games which are having moves made on
+        them are skipped, as are games which fail to save
+        """
+        with self._lock:
+            if self._squares <= self.max_squares:
+                return
+            candidates = list(self._games)[:-1]
+
+        for game_id in candidates:
+            with self._lock:
+                if self._squares <= self.max_squares:
+                    return
+            # this thread may be holding the lock of another game, so waiting
+            # for this one's could deadlock
+            if not self.locks.try_acquire(game_id):
+                continue
+            try:
+                self._flush(game_id)
+                with self._lock:
+                    if game_id in self._games and game_id not in self._dirty:
+                        self._discard(game_id)
+                        self.evictions += 1
+            except Exception: # pylint: disable=broad-except
+                # keep it until it can be saved, rather than failing the
+                # lookup which caused the eviction
+                logger.exception('Failed to write back evicted game %s', game_id)
+            finally:
+                self.locks.release(game_id)
+
+    def _discard(self, game_id, keep_dirty=False):
+        """
+        Remove a game from the cache without saving it
+        """
+        game = self._games.pop(game_id, None)
+        if game is not None:
+            self._squares -= len(game.grid.board)
+        if not keep_dirty:
+            self._dirty.discard(game_id)
+
+    def _flush(self, game_id):
+        """
+        Save a game if it has unsaved changes. The game's lock must be held
+        """
+        with self._lock:
+            if game_id not in self._dirty:
+                return
+            game = self._games[game_id]
+            self._dirty.discard(game_id)
+
+        try:
+            saved = game.save_state()
+        except BaseException:
+            with self._lock:
+                if self._games.get(game_id) is game:
+                    self._dirty.add(game_id)
+            raise
+
+        with self._lock:
+            self.flushes += 1
+            if not saved:
+                # the game was deleted, so this copy is no use any more
+                self._discard(game_id)
+
+    def get(self, game_id):
+        """
+        Get a copy of a game by its ID, for reading only. It is copied with
+        the game's lock held, so it is never halfway through a move
+        """
+        with self.locks.hold(game_id):
+            game = self._copy(self._load(game_id))
+        self._evict()
+        return game
+
+    @contextmanager
+    def checkout(self, game_id, check=None):
+        """
+        Get a game by its ID in order to make a move.
+        The changes made to it are saved when the block exits, or thrown away
+        if it raises, going back to the game as it was before the block.
+
+        `check` is called with the game before the block runs. If it returns
+        False, None is given to the block instead of the game and nothing is
+        saved.
+
+        Raises MoveConflict when the block exits if another worker made a move
+        on the game first, see the class docstring
+        """
+        with self.locks.hold(game_id):
+            game = self._load(game_id)
+            self._evict()
+            if check is not None and not check(game):
+                yield None
+                return
+
+            previous_version = game.version
+            # if there are moves which haven't been saved yet, keep a copy to
+            # go back to, so that they aren't lost along with the block's
+            with self._lock:
+                backup = None
+                if game.id in self._dirty:
+                    backup = (game.dump_state(), list(game.pending_snapshots))
+            try:
+                yield game
+            except BaseException:
+                with self._lock:
+                    if backup is None:
+                        self._discard(game.id)
+                    else:
+                        restored = Game.from_state(backup[0])
+                        restored.pending_snapshots.extend(backup[1])
+                        self._put(restored)
+                raise
+
+            if self.store is not None and not self.store.compare_and_set(
+                    game.id, previous_version, game.version, game.dump_state()):
+                with self._lock:
+                    self._discard(game.id)
+                    self.conflicts += 1
+                raise MoveConflict(game.id)
+
+            for listener in self.listeners:
+                try:
+                    listener(game, previous_version)
+                except Exception: # pylint: disable=broad-except
+                    logger.exception('Move listener failed for game %s', game.id)
+
+            with self._lock:
+                self._dirty.add(game.id)
+            if self.flush_interval <= 0 or game.status != 'O':
+                self._flush(game.id)
+            else:
+                self._start_flusher()
+
+    def invalidate(self, game_id):
+        """
+        Forget a game without saving it, e.g. after it was changed directly in
+        the database
+        """
+        with self.locks.hold(game_id), self._lock:
+            self._discard(game_id)
+            if self.store is not None:
+                self.store.delete(game_id)
+
+    def remove(self, game_id):
+        """
+        Forget a game which has been deleted from the database, and make every
+        worker sharing the store forget it too
+        """
+        with self.locks.hold(game_id), self._lock:
+            self._discard(game_id)
+            if self.store is not None:
+                self.store.bury(game_id)
+
+    def flush(self):
+        """
+        Save every game with unsaved changes. Games which fail to save are
+        logged and left to be saved by a later flush
+        """
+        with self._lock:
+            dirty = list(self._dirty)
+        for game_id in dirty:
+            try:
+                with self.locks.hold(game_id):
+                    self._flush(game_id)
+            except Exception: # pylint: disable=broad-except
+                logger.exception('Failed to write back game %s', game_id)
+
+    def clear(self):
+        """
+        Save and forget every game
+        """
+        self.flush()
+        with self._lock:
+            for game_id in list(self._games):
+                self._discard(game_id)
+
+    def stats(self):
+        """
+        Get the counters for this cache
+        """
+        with self._lock:
+            return {
+                'games': len(self._games),
+                'squares': self._squares,
+                'dirty': len(self._dirty),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'shared_hits': self.shared_hits,
+                'evictions': self.evictions,
+                'flushes': self.flushes,
+                'conflicts': self.conflicts,
+            }
+
+    def _start_flusher(self):
+        """
+        Start the background thread which writes back changes, if it isn't
+        running already
+        """
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_forever, daemon=True)
+            self._flusher.start()
+
+    def _flush_forever(self):
+        """
+        Write back changes every `flush_interval` seconds
+        """
+        wake = threading.Event()
+        while not wake.wait(self.flush_interval):
+            try:
+                self.flush()
+                if self.store is not None:
+                    self.store.sweep()
+            except Exception: # pylint: disable=broad-except
+                logger.exception('Failed to write back cached games')
+            finally:
+                # this thread has its own connection which would otherwise
+                # be held open between flushes
+                connection.close()
+
+
+games_cache = GameCache(
+    max_squares=settings.GAME_CACHE['MAX_SQUARES'],
+    flush_interval=settings.GAME_CACHE['FLUSH_INTERVAL'],
+    store=get_store(
+        settings.GAME_CACHE.get('STORE'), database_namespace(settings.DATABASES['default']),
+    ),
+)
+
+# don't lose the moves which haven't been written back yet on shutdown
+atexit.register(games_cache.flush)
+
+def forget_new_game(sender, instance, created, **kwargs):
+    """
+    Receive `post_save` for games, to forget whatever is cached under the ID
+    of a new game. That can only be left over from a database which has since
+    been replaced, e.g. one made for a test run
+    """
+    if created:
+        games_cache.invalidate(instance.id)
@@ -0,0 +1,17 @@
+"""
+Setting up database connections as they are opened
+"""
+from django.conf import settings
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Apply the SQLITE_PRAGMAS setting to a new SQLite connection, so that
+    several workers can read and write the same file without timing out.
+    Connected to `connection_created` when the app is ready
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
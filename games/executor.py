@@ -0,0 +1,57 @@
+"""
+A pool of threads for the async views to do their work in, so that the event
+loop can keep handling other requests while moves, board generation and
+database queries run
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'GAME_EXECUTOR_WORKERS', None),
+    thread_name_prefix='games',
+)
+
+def _call(func, args, kwargs):
+    """
+    Call a function in one of the executor's threads
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # the thread outlives the request, so tidy up its database connection
+        # the way the end of a request would
+        close_old_connections()
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Call a function in the executor and wait for the result without blocking
+    the event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _call, func, args, kwargs)
+
+def offload(method):
+    """
+    Decorate a view method to make it async, running the method itself in the
+    executor
+    """
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        return await run_in_executor(method, *args, **kwargs)
+    return wrapper
+
+async def iterate_in_executor(iterator):
+    """
+    Iterate over a plain iterator one item at a time in the executor, for
+    streaming responses which are served asynchronously
+    """
+    done = object()
+    while True:
+        item = await run_in_executor(next, iterator, done)
+        if item is done:
+            return
+        yield item
@@ -0,0 +1,222 @@
+"""
+Models for games on a board with no edges, whose chunks are generated as they
+are needed by `games.world`
+"""
+import random
+
+from django.db import models, transaction
+
+from .board import FLAG, MINE
+from .utilities import GAME_STATUSES, mine_probability, run_length_encode
+from .world import CHUNK_SIZE, MAX_REVEAL, World
+
+
+class InfiniteGame(models.Model):
+    """
+    A game on a board with no edges, which is split into chunks that are only
+    generated and stored once they are played on (see `games.world`). There
+    is no winning, just revealing as much as possible before hitting a mine
+    """
+    status = models.CharField(max_length=1, choices=GAME_STATUSES)
+    difficulty = models.FloatField(help_text='Chance of each square to be a mine')
+    seed = models.BigIntegerField(help_text='Seed to generate the chunks with')
+    chunk_size = models.PositiveIntegerField(default=CHUNK_SIZE)
+    version = models.PositiveIntegerField(default=0, help_text='Number of moves made')
+    revealed = models.PositiveIntegerField(default=0, help_text='Squares revealed without mines')
+    flags = models.PositiveIntegerField(default=0, help_text='Flags on unrevealed squares')
+
+    # the most squares that can be fetched at once with `window`
+    MAX_WINDOW = 256 * 256
+
+    # the most squares that the first reveal, made for the player, opens up,
+    # so that new games only store the few chunks around (0, 0)
+    MAX_OPENING = 1000
+
+    @property
+    def world(self):
+        """
+        The chunks that have been loaded so far, which is kept around so that
+        changes to them can be saved with `save_chunks`
+        """
+        if getattr(self, '_world', None) is None:
+            self._world = World(
+                self.seed, mine_probability(self.difficulty), self.chunk_size, self._load_chunk,
+            )
+            self._chunk_ids = {}
+        return self._world
+
+    def _load_chunk(self, cx, cy):
+        """
+        Load the cells of a stored chunk, or None if it isn't stored
+        """
+        chunk = self.chunk_set.filter(x=cx, y=cy).only('id', 'cells').first()
+        if chunk is None:
+            return None
+        self._chunk_ids[cx, cy] = chunk.id
+        return bytes(chunk.cells)
+
+    def load_chunks(self, cx0, cy0, cx1, cy1):
+        """
+        Load every stored chunk with cx0 <= cx <= cx1 and cy0 <= cy <= cy1 in
+        one query, instead of one at a time as they are needed
+        """
+        world = self.world
+        stored = {}
+        chunks = self.chunk_set.filter(x__range=(cx0, cx1), y__range=(cy0, cy1))
+        for chunk in chunks.only('id', 'x', 'y', 'cells'):
+            self._chunk_ids[chunk.x, chunk.y] = chunk.id
+            stored[chunk.x, chunk.y] = bytes(chunk.cells)
+        world.preload(
+            ((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)),
+            stored,
+        )
+
+    def save_chunks(self):
+        """
+        Save the chunks which have changed since they were loaded
+        """
+        world = self.world
+        new, changed = [], []
+        for key in world.changed:
+            chunk = Chunk(
+                id=self._chunk_ids.get(key),
+                game=self,
+                x=key[0],
+                y=key[1],
+                cells=bytes(world.chunks[key].cells),
+            )
+            (changed if chunk.id is not None else new).append(chunk)
+
+        Chunk.objects.bulk_update(changed, ['cells'])
+        for chunk in Chunk.objects.bulk_create(new):
+            if chunk.id is not None:
+                self._chunk_ids[chunk.x, chunk.y] = chunk.id
+        world.changed.clear()
+
+    def save_state(self):
+        """
+        Save the game and the chunks changed by its moves
+        """
+        with transaction.atomic():
+            self.save_chunks()
+            self.save()
+
+    def window(self, x0, y0, x1, y1, encoding=None):
+        """
+        Get the squares with x0 <= x < x1 and y0 <= y < y1 as a string, like
+        `Grid.public_data` with `encoding` 'packed' or 'rle'. The mines are
+        shown once the game is lost
+        """
+        size = self.chunk_size
+        self.load_chunks(x0 // size, y0 // size, (x1 - 1) // size, (y1 - 1) // size)
+        cells = self.world.window(x0, y0, x1, y1, show_mines=self.status == 'L')
+        return {
+            'id': self.id,
+            'status': self.status,
+            'difficulty': self.difficulty,
+            'version': self.version,
+            'revealed': self.revealed,
+            'flags': self.flags,
+            'window': {'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1},
+            'cells': run_length_encode(cells) if encoding == 'rle' else cells,
+        }
+
+    def _reveal(self, coords, limit=MAX_REVEAL):
+        """
+        Reveal the squares at the given coordinates, and at most `limit`
+        squares in all, ending the game if any of them has a mine. Returns the
+        coordinates of the revealed squares
+        """
+        world = self.world
+        self.version += 1
+        revealed = world.reveal(*coords, limit=limit)
+        mines = 0
+        for revealed_coords in revealed:
+            cell = world.cell(*revealed_coords)
+            if cell & FLAG:
+                self.flags -= 1
+            if cell & MINE:
+                mines += 1
+        self.revealed += len(revealed) - mines
+        if mines:
+            self.status = 'L'
+        return revealed
+
+    def _reveal_result(self, revealed):
+        """
+        Make the result object for a reveal or chord, like `Game.reveal`
+        """
+        world = self.world
+        squares = [world.cell_data(*coords) for coords in revealed]
+        if self.status == 'L':
+            return {
+                'result': 'fail',
+                'data': {
+                    'mines': [square for square in squares if square['has_mine']],
+                    'revealed': self.revealed,
+                },
+            }
+        return {
+            'result': 'success',
+            'data': {
+                'revealed': squares,
+                'game_status': self.status,
+            },
+        }
+
+    def reveal(self, x, y):
+        """
+        Reveal the square at (x, y). Returns a result object like
+        `Game.reveal`. Call `save_state` to persist the move
+        """
+        return self._reveal_result(self._reveal([(x, y)]))
+
+    def chord(self, x, y):
+        """
+        Reveal every unflagged neighbour of the square at (x, y), like
+        `Game.chord`. Call `save_state` to persist the move
+        """
+        return self._reveal_result(self._reveal(self.world.chord_targets(x, y)))
+
+    def flag(self, x, y, value):
+        """
+        Add or remove the flag on the square at (x, y). Call `save_state` to
+        persist the move
+        """
+        self.version += 1
+        if self.world.set_flag(x, y, value):
+            self.flags += 1 if value else -1
+        return {
+            'flags': self.flags,
+        }
+
+    @classmethod
+    def new(cls, difficulty, seed=None):
+        """
+        Generate a new game with the given difficulty, with the squares around
+        (0, 0) already revealed. Passing the same seed again generates the same
+        board
+        """
+        rng = random.Random(seed)
+        with transaction.atomic():
+            game = cls.objects.create(difficulty=difficulty, status='O', seed=rng.getrandbits(63))
+            game._reveal([(0, 0)], cls.MAX_OPENING)
+            game.version = 0
+            game.save_state()
+            return game
+
+
+class Chunk(models.Model):
+    """
+    The packed cells of a chunk of an `InfiniteGame` which has been played on.
+    Chunks which haven't been played on are generated again when needed
+    """
+    game = models.ForeignKey(InfiniteGame, on_delete=models.CASCADE)
+    x = models.IntegerField()
+    y = models.IntegerField()
+    cells = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'x', 'y'], name='unique_chunk'),
+        ]
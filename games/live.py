@@ -0,0 +1,315 @@
+"""
+Live updates for everyone watching or playing a game, over WebSockets
+
+Every move is published as a diff of the squares that changed (see
+`Game.changes_since`). The hub in each process hands the diffs out to the
+sockets subscribed to the game, and a backend carries them between processes:
+`LocalBackend` for a single process, or `RedisBackend` for several.
+
+Diffs are merged for each subscriber over a short tick, so that a burst of
+moves or a big reveal is sent as one message. Subscribers which fall too far
+behind are disconnected rather than slowing down the players
+"""
+import asyncio
+import json
+import logging
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .cache import games_cache
+from .executor import run_in_executor
+from .models import Game
+
+logger = logging.getLogger(__name__)
+
+# close code for subscribers which are disconnected for falling behind
+CLOSE_TOO_SLOW = 1013
+
+PATH_PATTERN = re.compile(r'/ws/games/(\d+)')
+
+def merge_diffs(first, second):
+    """
+    Merge two diffs from `Game.changes_since`, with the squares in the second
+    taking the place of the same squares in the first
+    """
+    if first is None:
+        return second
+
+    squares = {(square['x'], square['y']): square for square in first['grid']['squares']}
+    for square in second['grid']['squares']:
+        squares[square['x'], square['y']] = square
+    merged = dict(second, since=first['since'])
+    merged['grid'] = dict(second['grid'], squares=list(squares.values()))
+    return merged
+
+
+class Subscription:
+    """
+    One subscriber to the diffs of a game. Diffs are merged until the end of
+    the tick and then queued to be sent, and if the queue is full the
+    subscriber is dropped. Only used from the event loop it was made in
+    """
+
+    def __init__(self, hub, game_id, loop):
+        self.hub = hub
+        self.game_id = game_id
+        self.loop = loop
+        self.dropped = False
+        self._pending = None
+        self._flush_handle = None
+        self._queue = asyncio.Queue(hub.max_queued)
+        self._dropped = asyncio.Event()
+
+    def add(self, diff):
+        """
+        Add a diff to be sent at the end of the tick
+        """
+        if self.dropped:
+            return
+        self._pending = merge_diffs(self._pending, diff)
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.hub.tick, self._flush)
+
+    def _flush(self):
+        """
+        Queue the diffs merged during the tick
+        """
+        self._flush_handle = None
+        diff, self._pending = self._pending, None
+        try:
+            self._queue.put_nowait(diff)
+        except asyncio.QueueFull:
+            self.drop()
+
+    def drop(self):
+        """
+        Stop sending diffs, and throw away those which haven't been sent
+        """
+        if self.dropped:
+            return
+        self.dropped = True
+        self.hub.unsubscribe(self)
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._pending = None
+        self._queue = asyncio.Queue()
+        self._dropped.set()
+
+    async def get(self):
+        """
+        Wait for the next diff to send
+        """
+        return await self._queue.get()
+
+    async def wait_dropped(self):
+        """
+        Wait until the subscriber is dropped
+        """
+        await self._dropped.wait()
+
+
+class Hub:
+    """
+    The subscribers in this process, by game ID. Diffs can be delivered from
+    any thread
+    """
+
+    def __init__(self, tick, max_queued):
+        self.tick = tick
+        self.max_queued = max_queued
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, game_id):
+        """
+        Subscribe to a game from the running event loop. Returns the
+        `Subscription`
+        """
+        subscription = Subscription(self, game_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[game_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Stop delivering diffs to a subscription
+        """
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.game_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.game_id]
+
+    def has_subscribers(self, game_id):
+        """
+        Check if anyone in this process is subscribed to a game
+        """
+        return game_id in self._subscriptions
+
+    def deliver(self, game_id, diff):
+        """
+        Pass a diff on to every subscriber to the game
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(game_id, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.add, diff)
+
+
+class LocalBackend:
+    """
+    Delivers diffs straight to the hub, for when there is only one process
+    """
+
+    def __init__(self, hub, location=None):
+        self.hub = hub
+
+    def start(self):
+        """
+        Get ready to deliver diffs from other processes (there are none)
+        """
+
+    def wants(self, game_id):
+        """
+        Check if diffs for a game need publishing at all
+        """
+        return self.hub.has_subscribers(game_id)
+
+    def publish(self, game_id, diff):
+        """
+        Send a diff to everyone subscribed to the game
+        """
+        self.hub.deliver(game_id, diff)
+
+
+class RedisBackend:
+    """
+    Sends diffs through Redis pub/sub, so that subscribers in every process
+    get them. Needs the `redis` package
+    """
+
+    def __init__(self, hub, location, prefix='minesweeper:live:'):
+        import redis # pylint: disable=import-error
+
+        self.hub = hub
+        self.client = redis.Redis.from_url(location)
+        self.prefix = prefix
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start listening for diffs from every process, if this process isn't
+        already
+        """
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name='live-updates', daemon=True,
+                )
+                self._listener.start()
+
+    def _listen(self):
+        """
+        Deliver the diffs published by every process to the hub, forever
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + '*')
+        for message in pubsub.listen():
+            try:
+                game_id = int(message['channel'][len(self.prefix):])
+                self.hub.deliver(game_id, json.loads(message['data']))
+            except Exception: # pylint: disable=broad-except
+                logger.exception('Failed to deliver a live update')
+
+    def wants(self, game_id):
+        """
+        Check if diffs for a game need publishing at all. Subscribers could be
+        in any process, so they always do
+        """
+        return True
+
+    def publish(self, game_id, diff):
+        """
+        Send a diff to everyone subscribed to the game, in every process
+        """
+        self.client.publish(self.prefix + str(game_id), json.dumps(diff))
+
+
+def get_backend(hub, config):
+    """
+    Make the backend described by a dict with the dotted path to its class
+    in 'BACKEND' and where to connect in 'LOCATION'
+    """
+    backend = import_string(config.get('BACKEND') or 'games.live.LocalBackend')
+    return backend(hub, config.get('LOCATION'))
+
+
+def publish_move(game, previous_version):
+    """
+    Publish the squares changed by moves made since `previous_version`. This
+    is added to the listeners of `games_cache` when the app is ready
+    """
+    if backend.wants(game.id):
+        backend.publish(game.id, game.changes_since(previous_version))
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI application for the sockets on /ws/games/<id>, which send a JSON diff
+    like `GET /api/games/<id>?since=<version>` whenever the game changes
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = PATH_PATTERN.fullmatch(scope['path'])
+    try:
+        if match is None:
+            raise Game.DoesNotExist()
+        game = await run_in_executor(games_cache.get, int(match.group(1)))
+    except Game.DoesNotExist:
+        await send({'type': 'websocket.close'})
+        return
+
+    backend.start()
+    subscription = hub.subscribe(game.id)
+    await send({'type': 'websocket.accept'})
+
+    async def send_diffs():
+        # start with the version, so the client knows which diffs it needs
+        await send({'type': 'websocket.send', 'text': json.dumps({'version': game.version})})
+        while True:
+            diff = await subscription.get()
+            await send({'type': 'websocket.send', 'text': json.dumps(diff)})
+
+    sender = asyncio.ensure_future(send_diffs())
+    dropped = asyncio.ensure_future(subscription.wait_dropped())
+    receiving = None
+    try:
+        # nothing is expected from the client, so just wait for it to leave
+        while True:
+            receiving = asyncio.ensure_future(receive())
+            await asyncio.wait([receiving, dropped], return_when=asyncio.FIRST_COMPLETED)
+            if dropped.done():
+                # it fell behind, so give up on whatever is still being sent
+                sender.cancel()
+                await send({'type': 'websocket.close', 'code': CLOSE_TOO_SLOW})
+                return
+            if receiving.result()['type'] == 'websocket.disconnect':
+                return
+    finally:
+        for task in (sender, dropped, receiving):
+            if task is not None:
+                task.cancel()
+        subscription.drop()
+
+
+LIVE_UPDATES = getattr(settings, 'LIVE_UPDATES', {})
+hub = Hub(tick=LIVE_UPDATES.get('TICK', 0.05), max_queued=LIVE_UPDATES.get('MAX_QUEUED', 16))
+backend = get_backend(hub, LIVE_UPDATES)
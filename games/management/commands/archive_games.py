@@ -0,0 +1,104 @@
+"""
+Archive games which are over or abandoned, and give the space they took up
+back to the database
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils.timezone import now
+
+from games.cache import games_cache
+from games.models import ArchivedGame, Game
+
+
+class Command(BaseCommand):
+    help = 'Compress finished and idle games into archived games, a batch at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--finished-after', type=float, default=settings.ARCHIVE['FINISHED_AFTER'],
+            help='Days after the end of a game to archive it',
+        )
+        parser.add_argument(
+            '--idle-after', type=float, default=settings.ARCHIVE['IDLE_AFTER'],
+            help='Days after the last move to archive a game which is not over',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Number of games to archive in each transaction',
+        )
+        parser.add_argument(
+            '--vacuum-pages', type=int, default=1000,
+            help='Number of free SQLite pages to give back after each batch',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Keep running, archiving games every this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and not self.incremental_vacuum():
+            self.stderr.write(
+                'The database does not use incremental auto-vacuum, so deleted games will not '
+                'give back space until it is converted with VACUUM'
+            )
+
+        while True:
+            archived = self.archive(options)
+            if options['verbosity'] > 1 or options['interval'] is None:
+                self.stdout.write('Archived {} games'.format(archived))
+
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def archive(self, options):
+        """
+        Archive every game which is due, a batch at a time. Returns the number
+        of games archived
+        """
+        finished_before = now() - timedelta(days=options['finished_after'])
+        idle_before = now() - timedelta(days=options['idle_after'])
+        due = Game.objects.filter(
+            Q(status__in=('W', 'L'), updated__lt=finished_before)
+            | Q(status='O', updated__lt=idle_before)
+        )
+
+        archived = 0
+        while True:
+            game_ids = list(due.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not game_ids:
+                # catch up on space left over from earlier runs
+                self.vacuum(options['vacuum_pages'])
+                return archived
+
+            archived += ArchivedGame.archive(game_ids)
+            for game_id in game_ids:
+                # stop the workers from playing on their copies of the game
+                games_cache.remove(game_id)
+            self.vacuum(options['vacuum_pages'])
+
+    @staticmethod
+    def incremental_vacuum():
+        """
+        Check if the SQLite database can give back free pages a few at a time
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA auto_vacuum')
+            return cursor.fetchone()[0] == 2
+
+    def vacuum(self, pages):
+        """
+        Give back up to the given number of free pages of the SQLite database.
+        Other databases vacuum themselves
+        """
+        if connection.vendor != 'sqlite' or not pages or not self.incremental_vacuum():
+            return
+        # each step of the statement frees one page, and executing it through
+        # a cursor only takes the first step
+        connection.ensure_connection()
+        connection.connection.executescript('PRAGMA incremental_vacuum({:d});'.format(pages))
@@ -0,0 +1,48 @@
+"""
+Benchmark for the flood-fill reveal, to check that it scales linearly with the
+number of cells revealed
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from games.board import Board
+
+
+class Command(BaseCommand):
+    help = 'Time revealing boards of increasing size'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[125, 250, 500, 1000],
+            help='Side lengths of the square boards to reveal',
+        )
+        parser.add_argument(
+            '--mine-chance', type=float, default=0.0,
+            help='Probability of each cell having a mine (0 reveals the whole board)',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        mine_chance = options['mine_chance']
+
+        self.stdout.write('{:>6} {:>10} {:>10} {:>14}'.format(
+            'size', 'revealed', 'seconds', 'ns per cell',
+        ))
+        for size in options['sizes']:
+            board = Board.generate(size, size, mine_chance, rng)
+
+            # click the middle of the board, or the nearest cell without a mine
+            start = board.index(size // 2, size // 2)
+            while board.has_mine(start):
+                start += 1
+
+            began = time.perf_counter()
+            revealed = board.reveal(start)
+            elapsed = time.perf_counter() - began
+
+            self.stdout.write('{:>6} {:>10} {:>10.4f} {:>14.1f}'.format(
+                size, len(revealed), elapsed, elapsed / len(revealed) * 1e9,
+            ))
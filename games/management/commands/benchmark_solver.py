@@ -0,0 +1,76 @@
+"""
+Benchmark for the solver, over a fixed corpus of positions from part way
+through games
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from games.board import Board
+from games.solver import analyse
+
+# (width, height, mine chance, seed, rounds) for each position in the corpus.
+# Each one is made by revealing the middle of a seeded board and then
+# revealing every cell the solver finds to be safe, `rounds` times
+CORPUS = [
+    (15, 15, 0.1, 1, 3),
+    (15, 15, 0.15, 2, 3),
+    (15, 15, 0.2, 3, 3),
+    (30, 16, 0.15, 4, 5),
+    (30, 16, 0.2, 5, 5),
+    (50, 50, 0.1, 6, 5),
+    (50, 50, 0.15, 7, 5),
+    (50, 50, 0.2, 8, 5),
+    (100, 100, 0.1, 9, 5),
+    (100, 100, 0.15, 10, 5),
+    (100, 100, 0.2, 11, 5),
+    (100, 100, 0.2, 12, 0),
+]
+
+def make_position(width, height, mine_chance, seed, rounds):
+    """
+    Make the position for an entry of the corpus
+    """
+    board = Board(width, height)
+    start = board.index(width // 2, height // 2)
+    board.place_random_mines(
+        mine_chance, random.Random(seed), [start, *board.neighbours(start)],
+    )
+    board.reveal(start)
+
+    for _ in range(rounds):
+        safe = analyse(board, mine_chance).safe
+        if not safe:
+            break
+        board.reveal(*safe)
+    return board
+
+
+class Command(BaseCommand):
+    help = 'Time analysing the positions in the solver benchmark corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Number of times to analyse each position, keeping the fastest',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('{:>9} {:>6} {:>6} {:>7} {:>6} {:>6} {:>6} {:>10}'.format(
+            'size', 'chance', 'seed', 'hidden', 'safe', 'mines', 'exact', 'seconds',
+        ))
+        for width, height, mine_chance, seed, rounds in CORPUS:
+            board = make_position(width, height, mine_chance, seed, rounds)
+            hidden = len(board) - sum(1 for i in range(len(board)) if board.is_revealed(i))
+
+            elapsed = float('inf')
+            for _ in range(options['repeat']):
+                began = time.perf_counter()
+                analysis = analyse(board, mine_chance)
+                elapsed = min(elapsed, time.perf_counter() - began)
+
+            self.stdout.write('{:>9} {:>6} {:>6} {:>7} {:>6} {:>6} {:>6} {:>10.4f}'.format(
+                '{}x{}'.format(width, height), mine_chance, seed, hidden,
+                len(analysis.safe), len(analysis.mines), str(analysis.exact), elapsed,
+            ))
@@ -0,0 +1,52 @@
+"""
+Check that the counters on every grid agree with its board
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from games.cache import games_cache
+from games.models import Game, Grid
+
+
+class Command(BaseCommand):
+    help = 'Recount the mines, flags and hidden squares of every grid, optionally repairing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair', action='store_true',
+            help='Save the recounted values for grids which have drifted',
+        )
+
+    def handle(self, *args, **options):
+        checked = drifted = 0
+        for grid_id in Grid.objects.values_list('id', flat=True).iterator():
+            with transaction.atomic():
+                grid = Grid.objects.select_for_update().get(pk=grid_id)
+                counts = grid.count()
+                checked += 1
+
+                wrong = {
+                    name: (getattr(grid, name), value)
+                    for name, value in counts.items()
+                    if getattr(grid, name) != value
+                }
+                if not wrong:
+                    continue
+
+                drifted += 1
+                self.stdout.write('Grid {}: {}'.format(grid.id, ', '.join(
+                    '{} is {} but should be {}'.format(name, stored, actual)
+                    for name, (stored, actual) in wrong.items()
+                )))
+                if not options['repair']:
+                    continue
+                Grid.objects.filter(pk=grid.id).update(**counts)
+
+            # the workers would otherwise save their copies with the old
+            # counters over the repaired ones
+            for game_id in Game.objects.filter(grid_id=grid_id).values_list('id', flat=True):
+                games_cache.invalidate(game_id)
+
+        self.stdout.write('Checked {} grids, {} had drifted{}'.format(
+            checked, drifted, ' and were repaired' if options['repair'] and drifted else '',
+        ))
@@ -0,0 +1,63 @@
+"""
+Copy every game from one database to another, e.g. from the SQLite file to
+PostgreSQL after setting DATABASE_URL
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+
+class Command(BaseCommand):
+    help = 'Copy the games and their boards, moves and pooled boards between databases'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default='sqlite',
+            help='Database to copy from, as named in DATABASES',
+        )
+        parser.add_argument(
+            '--target', default='default',
+            help='Database to copy to, which must be migrated and have no games yet',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows to read and insert at a time',
+        )
+
+    def handle(self, *args, **options):
+        source, target = options['source'], options['target']
+        if source not in connections or target not in connections or source == target:
+            raise CommandError('--source and --target must be two different databases')
+
+        # models come in the order they are defined, which is after the
+        # models they refer to
+        models = list(apps.get_app_config('games').get_models())
+        for model in models:
+            if model.objects.using(target).exists():
+                raise CommandError('{} already has {} rows'.format(
+                    target, model._meta.object_name,
+                ))
+
+        with transaction.atomic(using=target):
+            for model in models:
+                copied = 0
+                batch = []
+                rows = model.objects.using(source).order_by('pk')
+                for row in rows.iterator(chunk_size=options['batch_size']):
+                    batch.append(row)
+                    if len(batch) >= options['batch_size']:
+                        model.objects.using(target).bulk_create(batch)
+                        copied += len(batch)
+                        batch = []
+                model.objects.using(target).bulk_create(batch)
+                copied += len(batch)
+                self.stdout.write('Copied {} {} rows'.format(
+                    copied, model._meta.object_name,
+                ))
+
+            # the IDs were copied, so carry on numbering after them
+            connection = connections[target]
+            with connection.cursor() as cursor:
+                for statement in connection.ops.sequence_reset_sql(no_style(), models):
+                    cursor.execute(statement)
@@ -0,0 +1,33 @@
+"""
+Keep the pool of pre-generated boards topped up
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from games.models import PooledBoard
+
+
+class Command(BaseCommand):
+    help = 'Generate boards ahead of time for each bucket in BOARD_POOL_BUCKETS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--depth', type=int, default=settings.BOARD_POOL_DEPTH,
+            help='Number of boards to keep in each bucket',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Keep running, refilling the pool every this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            added = PooledBoard.refill(options['depth'])
+            if options['verbosity'] > 1 or options['interval'] is None:
+                self.stdout.write('Added {} boards to the pool'.format(added))
+
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
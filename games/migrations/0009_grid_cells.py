@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+
+def pack_squares(apps, schema_editor):
+    """
+    Pack the squares of every existing grid into its `cells` field
+    """
+    from games.board import ADJACENT_SHIFT, FLAG, MINE, REVEALED
+
+    db_alias = schema_editor.connection.alias
+    Grid = apps.get_model('games', 'Grid')
+    Square = apps.get_model('games', 'Square')
+
+    for grid in Grid.objects.using(db_alias).iterator():
+        cells = bytearray(grid.width * grid.height)
+        squares = Square.objects.using(db_alias).filter(grid=grid).values_list(
+            'x', 'y', 'has_mine', 'has_flag', 'is_revealed', 'adjacent_mines',
+        )
+        for x, y, has_mine, has_flag, is_revealed, adjacent_mines in squares.iterator():
+            cells[y * grid.width + x] = (
+                (MINE if has_mine else 0)
+                | (FLAG if has_flag else 0)
+                | (REVEALED if is_revealed else 0)
+                | adjacent_mines << ADJACENT_SHIFT
+            )
+        grid.cells = bytes(cells)
+        grid.save(update_fields=['cells'])
+
+
+def unpack_squares(apps, schema_editor):
+    """
+    Recreate the squares of every grid from its `cells` field
+    """
+    from games.board import Board
+
+    db_alias = schema_editor.connection.alias
+    Grid = apps.get_model('games', 'Grid')
+    Square = apps.get_model('games', 'Square')
+
+    for grid in Grid.objects.using(db_alias).iterator():
+        board = Board(grid.width, grid.height, grid.cells)
+        Square.objects.using(db_alias).bulk_create(
+            Square(
+                grid=grid,
+                x=x,
+                y=y,
+                has_mine=board.has_mine(index),
+                has_flag=board.has_flag(index),
+                is_revealed=board.is_revealed(index),
+                adjacent_mines=board.adjacent_mines(index),
+            )
+            for index, (x, y) in ((i, board.coords(i)) for i in range(len(board)))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_square_adjacent_mines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grid',
+            name='cells',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(pack_squares, unpack_squares),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_grid_cells'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Square',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0010_delete_square'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledBoard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('difficulty', models.FloatField()),
+                ('cells', models.BinaryField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['width', 'height', 'difficulty'], name='games_poole_width_815af6_idx')],
+            },
+        ),
+    ]
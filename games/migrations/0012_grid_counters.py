@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+def count_boards(apps, schema_editor):
+    """
+    Fill in the counters for every existing grid
+    """
+    from games.board import Board
+
+    db_alias = schema_editor.connection.alias
+    Grid = apps.get_model('games', 'Grid')
+    for grid in Grid.objects.using(db_alias).iterator():
+        board = Board(grid.width, grid.height, grid.cells)
+        grid.mines = board.mine_total()
+        grid.flags = board.flag_total()
+        grid.hidden_safe = board.hidden_safe_total()
+        grid.save(update_fields=['mines', 'flags', 'hidden_safe'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0011_pooledboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grid',
+            name='flags',
+            field=models.PositiveIntegerField(default=0, help_text='Flags on unrevealed squares'),
+        ),
+        migrations.AddField(
+            model_name='grid',
+            name='hidden_safe',
+            field=models.PositiveIntegerField(default=0, help_text='Squares without mines which are not yet revealed'),
+        ),
+        migrations.AddField(
+            model_name='grid',
+            name='mines',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_boards, migrations.RunPython.noop),
+    ]
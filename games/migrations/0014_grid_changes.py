@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0013_game_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grid',
+            name='changes',
+            field=models.BinaryField(default=b''),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0014_grid_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grid',
+            name='mine_chance',
+            field=models.FloatField(help_text='Chance of each square to be a mine, if no mines are placed yet', null=True),
+        ),
+        migrations.AddField(
+            model_name='grid',
+            name='seed',
+            field=models.BigIntegerField(help_text='Seed to place the mines with', null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0015_grid_lazy_mines'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pooledboard',
+            name='games_poole_width_815af6_idx',
+        ),
+        migrations.AddField(
+            model_name='grid',
+            name='no_guess',
+            field=models.BooleanField(default=False, help_text='Whether the mines are placed so that no guessing is needed'),
+        ),
+        migrations.AddField(
+            model_name='pooledboard',
+            name='no_guess',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='pooledboard',
+            index=models.Index(fields=['width', 'height', 'difficulty', 'no_guess'], name='games_poole_width_284943_idx'),
+        ),
+    ]
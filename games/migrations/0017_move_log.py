@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0016_no_guess_boards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Move',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('action', models.CharField(choices=[('reveal', 'Reveal'), ('chord', 'Chord'), ('flag', 'Flag'), ('unflag', 'Unflag')], max_length=6)),
+                ('index', models.PositiveIntegerField(help_text='Index of the square on the board')),
+                ('created', models.DateTimeField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.game')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('game', 'version'), name='unique_move_version')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('state', models.BinaryField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.game')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('game', 'version'), name='unique_snapshot_version')],
+            },
+        ),
+    ]
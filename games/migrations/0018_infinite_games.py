@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0017_move_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InfiniteGame',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('W', 'Won'), ('L', 'Lost'), ('O', 'Ongoing')], max_length=1)),
+                ('difficulty', models.FloatField(help_text='Chance of each square to be a mine')),
+                ('seed', models.BigIntegerField(help_text='Seed to generate the chunks with')),
+                ('chunk_size', models.PositiveIntegerField(default=32)),
+                ('version', models.PositiveIntegerField(default=0, help_text='Number of moves made')),
+                ('revealed', models.PositiveIntegerField(default=0, help_text='Squares revealed without mines')),
+                ('flags', models.PositiveIntegerField(default=0, help_text='Flags on unrevealed squares')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Chunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('x', models.IntegerField()),
+                ('y', models.IntegerField()),
+                ('cells', models.BinaryField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.infinitegame')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('game', 'x', 'y'), name='unique_chunk')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0018_infinite_games'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('W', 'Won'), ('L', 'Lost'), ('O', 'Ongoing')], max_length=1)),
+                ('state', models.BinaryField()),
+                ('updated', models.DateTimeField(help_text='When the game was last saved')),
+                ('archived', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='updated',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='When the game was last saved'),
+        ),
+    ]
@@ -2,139 +2,348 @@
 Models needed for a game of minesweeper
 """
 
-from django.db import models
+import json
+import random
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils.timezone import now
+
+from .board import Board
+from .infinite import Chunk, InfiniteGame # pylint: disable=unused-import
+from .solver import GenerationTimeout, analyse, generate_no_guess
+from .utilities import GAME_STATUSES, mine_probability, run_length_encode
+
+def from_values(model, values):
+    """
+    Make an instance of a model as if it had been loaded from the database,
+    from a dict of field values. Fields which are missing are deferred
+    """
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db('default', names, [values[name] for name in names])
+
+def no_guess_board(width, height, mine_chance, start, rng=random, fallback=None):
+    """
+    Generate a board which can be won from revealing the cell at `start`
+    without guessing, within the time limit from the NO_GUESS setting. If
+    there isn't one in time, a random board with the cells around `start` kept
+    clear is used if `fallback` (by default, the setting) is 'random', and
+    otherwise GenerationTimeout is raised
+    """
+    config = getattr(settings, 'NO_GUESS', {})
+    try:
+        return generate_no_guess(
+            width, height, mine_chance, start, rng, config.get('TIME_LIMIT', 0.5),
+        )
+    except GenerationTimeout:
+        if (fallback or config.get('FALLBACK', 'random')) != 'random':
+            raise
+
+    board = Board(width, height)
+    board.place_random_mines(mine_chance, rng, [start, *board.neighbours(start)])
+    return board
+
+def opened_no_guess_board(width, height, mine_chance, rng=random, fallback=None):
+    """
+    Like `no_guess_board`, but with the first reveal already made in the
+    middle of the board, for boards which are generated before the player
+    has revealed anything
+    """
+    start = height // 2 * width + width // 2
+    board = no_guess_board(width, height, mine_chance, start, rng, fallback)
+    board.reveal(start)
+    return board
 
-from .utilities import (
-    chance,
-    init_2d_list,
-    matrix_adjacent_iter,
-    matrix_iter,
-)
 
 class Grid(models.Model):
     """
-    A grid of squares, each of which may or may not have a mine
+    A grid of squares, each of which may or may not have a mine. The squares
+    are stored packed into `cells`, see `games.board`
     """
     width = models.PositiveIntegerField(default=20)
     height = models.PositiveIntegerField(default=20)
+    cells = models.BinaryField(default=b'')
+
+    # kept up to date with the board so that they don't have to be counted
+    mines = models.PositiveIntegerField(default=0)
+    flags = models.PositiveIntegerField(default=0, help_text='Flags on unrevealed squares')
+    hidden_safe = models.PositiveIntegerField(
+        default=0, help_text='Squares without mines which are not yet revealed',
+    )
+
+    # the version of the game in which each square last changed, packed as
+    # little-endian 32-bit integers
+    changes = models.BinaryField(default=b'')
 
-    def get_all_2d(self):
+    # set until the mines are placed by the first reveal, see `place_mines`
+    mine_chance = models.FloatField(
+        null=True, help_text='Chance of each square to be a mine, if no mines are placed yet',
+    )
+    seed = models.BigIntegerField(null=True, help_text='Seed to place the mines with')
+    no_guess = models.BooleanField(
+        default=False, help_text='Whether the mines are placed so that no guessing is needed',
+    )
+
+    COUNTERS = ('mines', 'flags', 'hidden_safe')
+    ENCODINGS = ('packed', 'rle')
+
+    # plain fields which are included by `Game.dump_state`
+    STATE_FIELDS = ('id', 'width', 'height', *COUNTERS, 'mine_chance', 'seed', 'no_guess')
+
+    @property
+    def board(self):
         """
-        Get all square in the grid as a 2D array
+        The unpacked board, which is kept around so that changes to it can be
+        saved with `save_board`
         """
-        squares = self.square_set.all()
-        grid = [[None for x in range(self.width)] for y in range(self.height)]
-        for square in squares:
-            grid[square.y][square.x] = square
-        return grid
+        if getattr(self, '_board', None) is None:
+            self._board = Board(self.width, self.height, self.cells)
+        return self._board
 
-    def reveal_squares(self, clicked_square):
+    @property
+    def change_versions(self):
         """
-        Reveal the given square, and recursively any blank squares
+        The unpacked `changes`, kept around like `board`
         """
-        all_squares = self.get_all_2d()
-        revealed = [clicked_square]
-        seen_squares = [] # maintain list of seen squares to prevent infinite recursion
-
-        # maintain a queue of blocks to avoid actual recursion
-        queue = [clicked_square]
-        while queue:
-            current = queue.pop() # get the next square from the list
-
-            # if this isn't a blank tile, we shouldn't reveal its neighbours
-            if current.adjacent_mines != 0:
-                continue
-
-            # for each of the squares which are adjacent,
-            # reveal if there is no mine, and recurse if no adjacent mines
-            for adjacent_square in matrix_adjacent_iter(all_squares, current.x, current.y):
-                # don't process a square more than once
-                if adjacent_square in seen_squares:
-                    continue
+        if getattr(self, '_change_versions', None) is None:
+            versions = array('I')
+            if self.changes:
+                versions.frombytes(self.changes)
+                if sys.byteorder == 'big':
+                    versions.byteswap()
+            else:
+                versions.extend(bytes(self.width * self.height))
+            self._change_versions = versions
+        return self._change_versions
+
+    def pack_changes(self):
+        """
+        Get `change_versions` packed as stored in `changes`
+        """
+        versions = self.change_versions
+        if sys.byteorder == 'big':
+            versions = array('I', versions)
+            versions.byteswap()
+        return versions.tobytes()
 
-                if not adjacent_square.has_mine:
-                    adjacent_square.is_revealed = True
-                    revealed.append(adjacent_square)
+    def mark_changed(self, indices, version):
+        """
+        Record that the squares at the given indices changed in `version`
+        """
+        versions = self.change_versions
+        for index in indices:
+            versions[index] = version
 
-                if adjacent_square.adjacent_mines == 0:
-                    seen_squares.append(adjacent_square)
-                    queue.append(adjacent_square)
+    def changed_since(self, version):
+        """
+        Get the indices of the squares which changed after `version`
+        """
+        return [index for index, changed in enumerate(self.change_versions) if changed > version]
 
-        # update all of the revealed squares at once
-        revealed_ids = [square.id for square in revealed]
-        self.square_set.filter(pk__in=revealed_ids).update(is_revealed=True)
-        return revealed
+    def save_board(self):
+        """
+        Pack the board back into `cells` and save it along with the counters
+        and changes
+        """
+        self.cells = bytes(self.board.cells)
+        self.changes = self.pack_changes()
+        self.save(update_fields=['cells', 'changes', 'mine_chance', *self.COUNTERS])
 
-    def mine_count(self):
+    def has_mines_placed(self):
         """
-        Get the apparent number of mines still on the playing field
+        Check if the mines have been placed on the board yet
         """
-        num_mines = self.square_set.filter(has_mine=True).count()
-        num_flags = self.square_set.filter(has_flag=True, is_revealed=False).count()
-        return max(num_mines - num_flags, 0)
+        return self.mine_chance is None
 
-    def public_data(self):
+    def place_mines(self, safe_indices):
+        """
+        Place the mines on a board which doesn't have them yet, keeping the
+        squares at the given indices and their neighbours clear, and update
+        the counters. The layout only depends on `seed` and the safe squares.
+        With `no_guess`, the board can be won from the first of the safe
+        squares without guessing, if such a board is found in time
+        """
+        board = self.board
+        rng = random.Random(self.seed)
+        if self.no_guess:
+            generated = no_guess_board(
+                self.width, self.height, self.mine_chance, safe_indices[0], rng,
+                fallback='random',
+            )
+            board.place_mines(generated.mine_layout())
+        else:
+            safe = set(safe_indices)
+            for index in safe_indices:
+                safe.update(board.neighbours(index))
+            board.place_random_mines(self.mine_chance, rng, safe)
+        self.mine_chance = None
+        self.recount()
+
+    def count(self):
         """
-        Get the fields that should be sent to the client
+        Calculate the counters from the board. Returns them as a dict
         """
+        board = self.board
         return {
-            'id': self.id,
-            'width': self.width,
-            'height': self.height,
-            'squares': [s.public_data() for s in self.square_set.all()],
-            'mine_count': self.mine_count(),
+            'mines': board.mine_total(),
+            'flags': board.flag_total(),
+            'hidden_safe': board.hidden_safe_total(),
         }
 
+    def recount(self):
+        """
+        Set the counters from the board, without saving
+        """
+        for name, value in self.count().items():
+            setattr(self, name, value)
 
-class Square(models.Model):
-    """
-    A single square in a grid, which may or may not have a mine
-    """
-    x = models.PositiveIntegerField()
-    y = models.PositiveIntegerField()
-    has_mine = models.BooleanField()
-    has_flag = models.BooleanField(default=False)
-    is_revealed = models.BooleanField(default=False)
-    adjacent_mines = models.SmallIntegerField(default=0)
+    def reveal(self, indices, version):
+        """
+        Reveal the squares at the given indices and any blank squares around
+        them as part of `version`, keeping the counters up to date. Returns
+        the revealed indices
+        """
+        if indices and not self.has_mines_placed():
+            self.place_mines(indices)
+
+        board = self.board
+        revealed = board.reveal(*indices)
+        for revealed_index in revealed:
+            if board.has_flag(revealed_index):
+                self.flags -= 1
+            if not board.has_mine(revealed_index):
+                self.hidden_safe -= 1
+        self.mark_changed(revealed, version)
+        return revealed
 
-    grid = models.ForeignKey(Grid, on_delete=models.CASCADE)
+    def reveal_mines(self, version):
+        """
+        Reveal every mine without a flag as part of `version`. Returns a tuple
+        of (unflagged_mines, incorrect_flags) indices
+        """
+        # only unflagged mines are revealed, so the counters are unaffected
+        unflagged_mines, incorrect_flags = self.board.reveal_mines()
+        self.mark_changed(unflagged_mines, version)
+        return unflagged_mines, incorrect_flags
 
-    class Meta:
-        unique_together = (('x', 'y', 'grid'),)
+    def set_flag(self, index, value, version):
+        """
+        Add or remove the flag on the square at the given index as part of
+        `version`, keeping the counters up to date. Returns whether the flag
+        changed
+        """
+        board = self.board
+        if not board.set_flag(index, value):
+            return False
+
+        self.mark_changed([index], version)
+        self.flags += 1 if value else -1
+        return True
 
-    def reveal(self):
+    def square_data(self, index):
         """
-        Reveal the current square and save
+        Get the fields of a single square that should be sent to the client
         """
-        self.is_revealed = True
-        self.save()
+        return self.board.cell_data(index)
 
-    def reveal_neighbours(self):
+    def mine_count(self):
         """
-        Reveal any neighbouring squares if they should be revealed
+        Get the apparent number of mines still on the playing field. Before
+        the mines are placed, this is how many there are expected to be
         """
-        return self.grid.reveal_squares(self)
+        mines = self.mines
+        if not self.has_mines_placed():
+            mines = round(self.mine_chance * self.width * self.height)
+        return max(mines - self.flags, 0)
 
-    def public_data(self):
+    def public_data(self, encoding=None, region=None):
         """
-        Get the fields that should be sent to the client
+        Get the fields that should be sent to the client. By default squares
+        are sent as a list of objects, but with an encoding from `ENCODINGS`
+        they are sent as a string in `cells` instead (see `Board.to_string`),
+        which is run-length encoded for 'rle'.
+
+        With a region of (x0, y0, x1, y1), only the squares with x0 <= x < x1
+        and y0 <= y < y1 are sent, which must be on the board
         """
         data = {
             'id': self.id,
-            'x': self.x,
-            'y': self.y,
-            'is_revealed': self.is_revealed,
+            'width': self.width,
+            'height': self.height,
+            'mine_count': self.mine_count(),
         }
 
-        # add adjacent_mines/has_flag only if relevant
-        if self.is_revealed:
-            data['has_mine'] = self.has_mine
-            data['adjacent_mines'] = self.adjacent_mines
+        board = self.board
+        if region is None:
+            region = (0, 0, self.width, self.height)
+        else:
+            data['region'] = dict(zip(('x0', 'y0', 'x1', 'y1'), region))
+        x0, y0, x1, y1 = region
+
+        if encoding is None:
+            data['squares'] = [
+                self.square_data(index)
+                for y in range(y0, y1)
+                for index in range(board.index(x0, y), board.index(x1, y))
+            ]
         else:
-            data['has_flag'] = self.has_flag
+            cells = board.region_to_string(*region)
+            if encoding == 'rle':
+                cells = run_length_encode(cells)
+            data['encoding'] = encoding
+            data['cells'] = cells
 
         return data
 
+    def iter_public_json(self, encoding=None):
+        """
+        Like `public_data`, but serialized to JSON as an iterator of strings,
+        a row of squares at a time, so that the whole board is never held as
+        objects at once. The board is copied first, since it may change while
+        the response is being sent
+        """
+        board = Board(self.width, self.height, self.board.cells)
+        data = {
+            'id': self.id,
+            'width': self.width,
+            'height': self.height,
+            'mine_count': self.mine_count(),
+        }
+        if encoding is not None:
+            data['encoding'] = encoding
+
+        # leave the object open to add the squares to it
+        yield json.dumps(data)[:-1]
+
+        if encoding is None:
+            yield ', "squares": ['
+            for y in range(board.height):
+                row = []
+                for index in range(y * board.width, (y + 1) * board.width):
+                    row.append(json.dumps(board.cell_data(index)))
+                yield (', ' if y else '') + ', '.join(row)
+            yield ']}'
+        else:
+            yield ', "cells": "'
+            pending = ''
+            for y in range(board.height):
+                cells = board.row_to_string(y)
+                if encoding != 'rle':
+                    yield cells
+                    continue
+
+                # hold back the last run, since it may carry on in the next row
+                cells = pending + cells
+                before_run = cells.rstrip(cells[-1])
+                pending = cells[len(before_run):]
+                yield run_length_encode(before_run)
+            yield run_length_encode(pending) + '"}'
+
 
 class Game(models.Model):
     """
@@ -143,71 +352,639 @@ class Game(models.Model):
     """
     DEFAULT_SIZE = 15
 
-    STATUSES = (
-        ('W', 'Won'),
-        ('L', 'Lost'),
-        ('O', 'Ongoing'),
-    )
+    STATUSES = GAME_STATUSES
 
     status = models.CharField(max_length=1, choices=STATUSES)
     difficulty = models.FloatField(help_text='Chance of each square to be a mine')
     grid = models.OneToOneField(Grid, on_delete=models.CASCADE)
+    version = models.PositiveIntegerField(default=0, help_text='Number of moves made')
+    updated = models.DateTimeField(
+        default=now, db_index=True, help_text='When the game was last saved',
+    )
+
+    MAX_SIZE = 100
+
+    # plain fields which are included by `dump_state`
+    STATE_FIELDS = ('id', 'status', 'difficulty', 'version')
 
     def is_won(self):
         """
         Check if this game has been won (all squares without mines have been revealed)
         """
-        return not self.grid.square_set.filter(has_mine=False, is_revealed=False).exists()
+        return self.grid.hidden_safe == 0
+
+    @property
+    def pending_moves(self):
+        """
+        The moves which haven't been added to the log by `save_state` yet, as
+        (version, action, index, time) tuples
+        """
+        if getattr(self, '_pending_moves', None) is None:
+            self._pending_moves = []
+        return self._pending_moves
+
+    @property
+    def pending_snapshots(self):
+        """
+        The snapshots which haven't been saved by `save_state` yet, as
+        (version, state) tuples
+        """
+        if getattr(self, '_pending_snapshots', None) is None:
+            self._pending_snapshots = []
+        return self._pending_snapshots
+
+    def save_state(self):
+        """
+        Save the board, its counters, and the status of the game, and add the
+        moves made since the last save to the log. Moves only change the game
+        in memory, so this has to be called to persist them.
+
+        The state isn't saved if the database already has this version of the
+        game or a newer one, so that workers can write back in any order. The
+        log is always saved, and moves which are already in it are skipped.
+
+        Returns False without saving anything if the game is no longer in the
+        database (e.g. it was archived), and True otherwise
+        """
+        with transaction.atomic():
+            newer = Game.objects.filter(pk=self.pk, version__lt=self.version).update(
+                status=self.status,
+                version=self.version,
+                updated=now(),
+            )
+            if newer:
+                self.grid.save_board()
+            elif not Game.objects.filter(pk=self.pk).exists():
+                self.pending_moves.clear()
+                self.pending_snapshots.clear()
+                return False
+
+            Move.objects.bulk_create(
+                [
+                    Move(
+                        game_id=self.id,
+                        version=version,
+                        action=action,
+                        index=index,
+                        created=datetime.fromtimestamp(made, timezone.utc),
+                    )
+                    for version, action, index, made in self.pending_moves
+                ],
+                ignore_conflicts=True,
+            )
+            Snapshot.objects.bulk_create(
+                [
+                    Snapshot(game_id=self.id, version=version, state=state)
+                    for version, state in self.pending_snapshots
+                ],
+                ignore_conflicts=True,
+            )
+        self.pending_moves.clear()
+        self.pending_snapshots.clear()
+        return True
+
+    def dump_state(self, pending=True):
+        """
+        Serialize the game and its board, to be loaded with `from_state`. This
+        is a JSON header with the plain fields and the moves which haven't
+        been logged yet (unless not `pending`), followed by the binary fields
+        of the grid
+        """
+        grid = self.grid
+        binary = [('cells', bytes(grid.board.cells)), ('changes', grid.pack_changes())]
+        header = {
+            'game': {name: getattr(self, name) for name in self.STATE_FIELDS},
+            'grid': {name: getattr(grid, name) for name in grid.STATE_FIELDS},
+            'binary': [[name, len(value)] for name, value in binary],
+        }
+        if pending and self.pending_moves:
+            header['moves'] = self.pending_moves
+        header = json.dumps(header).encode()
+        return b''.join([len(header).to_bytes(4, 'little'), header] + [v for _, v in binary])
 
-    def update_status(self, new_status):
+    def snapshot(self):
         """
-        Change the status to the given value and save it
+        Get the compressed state of the game, to be loaded by `at_version`
         """
-        self.status = new_status
-        self.save()
+        return zlib.compress(self.dump_state(pending=False))
 
-    def public_data(self):
+    @classmethod
+    def from_state(cls, state):
+        """
+        Load a game and its board from the output of `dump_state`, without
+        querying the database
+        """
+        length = int.from_bytes(state[:4], 'little')
+        header = json.loads(bytes(state[4:4 + length]).decode())
+
+        grid_values = header['grid']
+        offset = 4 + length
+        for name, size in header['binary']:
+            grid_values[name] = bytes(state[offset:offset + size])
+            offset += size
+
+        grid = from_values(Grid, grid_values)
+        game = from_values(cls, dict(header['game'], grid_id=grid.id))
+        game.grid = grid
+        game.pending_moves.extend(tuple(move) for move in header.get('moves', []))
+        return game
+
+    def at_version(self, version):
+        """
+        Rebuild the game as it was at the given version, by replaying the
+        moves since the newest snapshot at or before it. Returns None if the
+        log doesn't cover that version
+        """
+        if not 0 <= version <= self.version:
+            return None
+
+        # include whatever hasn't been saved yet
+        snapshots = [(v, state) for v, state in self.pending_snapshots if v <= version]
+        saved = self.snapshot_set.filter(version__lte=version).order_by('-version').first()
+        if saved is not None:
+            snapshots.append((saved.version, saved.state))
+        if not snapshots:
+            return None
+        start, state = max(snapshots, key=lambda snapshot: snapshot[0])
+
+        moves = {
+            move.version: (move.action, move.index)
+            for move in self.move_set.filter(version__gt=start, version__lte=version)
+        }
+        for move_version, action, index, _ in self.pending_moves:
+            if start < move_version <= version:
+                moves[move_version] = (action, index)
+
+        game = Game.from_state(zlib.decompress(state))
+        game.pending_moves.clear()
+        for move_version in range(start + 1, version + 1):
+            if move_version not in moves:
+                return None
+            game._move(*moves[move_version])
+        return game
+
+    def move_history(self):
+        """
+        Get every move in the log, including those which haven't been saved
+        yet, as data to send to the client
+        """
+        moves = {
+            move.version: (move.action, move.index, move.created)
+            for move in self.move_set.all()
+        }
+        for version, action, index, made in self.pending_moves:
+            moves[version] = (action, index, datetime.fromtimestamp(made, timezone.utc))
+
+        history = []
+        for version in sorted(moves):
+            action, index, created = moves[version]
+            y, x = divmod(index, self.grid.width)
+            history.append({
+                'version': version,
+                'action': action,
+                'x': x,
+                'y': y,
+                'created': created.isoformat(),
+            })
+        return history
+
+    def public_data(self, encoding=None, region=None):
         """
-        Get the fields that should be sent to the client
+        Get the fields that should be sent to the client. See
+        `Grid.public_data` for `encoding` and `region`
         """
         return {
             'id': self.id,
             'status': self.status,
             'difficulty': self.difficulty,
-            'grid': self.grid.public_data(),
+            'version': self.version,
+            'grid': self.grid.public_data(encoding, region),
         }
 
+    def iter_public_json(self, encoding=None):
+        """
+        Like `public_data`, but serialized to JSON as an iterator of strings.
+        See `Grid.iter_public_json`
+        """
+        data = {
+            'id': self.id,
+            'status': self.status,
+            'difficulty': self.difficulty,
+            'version': self.version,
+        }
+        yield json.dumps(data)[:-1] + ', "grid": '
+        yield from self.grid.iter_public_json(encoding)
+        yield '}'
+
+    def changes_since(self, version):
+        """
+        Get the fields that should be sent to a client which already has the
+        given version of the game, with only the squares that have changed
+        since then
+        """
+        grid = self.grid
+        return {
+            'id': self.id,
+            'status': self.status,
+            'version': self.version,
+            'since': version,
+            'grid': {
+                'id': grid.id,
+                'squares': [grid.square_data(i) for i in grid.changed_since(version)],
+                'mine_count': grid.mine_count(),
+            },
+        }
+
+    def hints(self, time_limit=None):
+        """
+        Work out what the player can know about the hidden squares next to
+        the revealed ones: whether they are safe or mines for certain, or
+        otherwise the probability of them having a mine. The board is copied
+        first, since it may change while this runs. See `solver.analyse` for
+        `time_limit`
+        """
+        grid = self.grid
+        version = self.version
+        board = Board(grid.width, grid.height, grid.board.cells)
+
+        # the player knows how many mines there are once they are placed
+        if grid.has_mines_placed():
+            analysis = analyse(board, mine_total=grid.mines, time_limit=time_limit)
+        else:
+            analysis = analyse(board, mine_chance=grid.mine_chance, time_limit=time_limit)
+
+        squares = []
+        for index in sorted(analysis.safe | analysis.mines | analysis.probabilities.keys()):
+            x, y = board.coords(index)
+            if index in analysis.safe:
+                squares.append({'x': x, 'y': y, 'verdict': 'safe'})
+            elif index in analysis.mines:
+                squares.append({'x': x, 'y': y, 'verdict': 'mine'})
+            else:
+                probability = round(analysis.probability(index), 4)
+                squares.append({'x': x, 'y': y, 'probability': probability})
+
+        interior = analysis.interior_probability
+        return {
+            'id': self.id,
+            'version': version,
+            'exact': analysis.exact,
+            'interior_probability': None if interior is None else round(interior, 4),
+            'squares': squares,
+        }
+
+    def _reveal(self, indices):
+        """
+        Reveal the squares at the given indices, ending the game if any of
+        them has a mine or all of the other squares have been revealed.
+        Returns a tuple of (revealed, unflagged_mines, incorrect_flags)
+        indices, where the last two are only filled in if the game was lost
+        """
+        grid = self.grid
+        self.version += 1
+        revealed = grid.reveal(indices, self.version)
+
+        if any(grid.board.has_mine(index) for index in indices):
+            unflagged_mines, incorrect_flags = grid.reveal_mines(self.version)
+            # end the game
+            self.status = 'L'
+            return revealed, unflagged_mines, incorrect_flags
+
+        # check if game is won (no unrevealed squares without mine)
+        if self.is_won():
+            self.status = 'W'
+        return revealed, [], []
+
+    def _flag(self, index, value):
+        """
+        Add or remove the flag on the square at the given index. Returns
+        whether the flag changed
+        """
+        self.version += 1
+        return self.grid.set_flag(index, value, self.version)
+
+    def _move(self, action, index):
+        """
+        Make a move, where the action is one of `MOVE_ACTIONS`, and add it to
+        the moves to be logged. Returns the output of `_reveal` for reveals
+        and chords, or of `_flag` otherwise.
+
+        A snapshot is kept every SNAPSHOT_INTERVAL moves, so that replaying
+        any version takes at most that many moves, and when the mines are
+        placed, since placing them again might not give the same board
+        """
+        grid = self.grid
+        placed = grid.has_mines_placed()
+        if action == 'reveal':
+            result = self._reveal([index])
+        elif action == 'chord':
+            result = self._reveal(grid.board.chord_targets(index))
+        else:
+            result = self._flag(index, action == 'flag')
+
+        self.pending_moves.append((self.version, action, index, time.time()))
+        interval = getattr(settings, 'SNAPSHOT_INTERVAL', 0)
+        if grid.has_mines_placed() != placed or (interval and not self.version % interval):
+            self.pending_snapshots.append((self.version, self.snapshot()))
+        return result
+
+    def reveal(self, index):
+        """
+        Reveal the square at the given index. Returns a result object, which is
+        either success with the revealed squares and game status, or failure
+        (from a mine). Call `save_state` to persist the move
+        """
+        return self._reveal_result(*self._move('reveal', index))
+
+    def chord(self, index):
+        """
+        Reveal every unflagged neighbour of the square at the given index, if
+        it is a revealed number with that many flags around it. Returns a
+        result object like `reveal`. Call `save_state` to persist the move
+        """
+        return self._reveal_result(*self._move('chord', index))
+
+    def _reveal_result(self, revealed, unflagged_mines, incorrect_flags):
+        """
+        Make the result object for a reveal or chord from the output of
+        `_reveal`
+        """
+        grid = self.grid
+
+        if self.status == 'L':
+            return {
+                'result': 'fail',
+                'data': {
+                    # a chord can reveal safe squares along with the mine
+                    'revealed': [grid.square_data(i) for i in revealed],
+                    'incorrect_flags': [grid.square_data(i) for i in incorrect_flags],
+                    'unflagged_mines': [grid.square_data(i) for i in unflagged_mines],
+                    'mine_count': grid.mine_count(),
+                },
+            }
+
+        return {
+            'result': 'success',
+            'data': {
+                'revealed': [grid.square_data(i) for i in revealed],
+                'game_status': self.status,
+                'mine_count': grid.mine_count(),
+            },
+        }
+
+    def flag(self, index, value):
+        """
+        Add or remove the flag on the square at the given index. Call
+        `save_state` to persist the move
+        """
+        self._move('flag' if value else 'unflag', index)
+        return {
+            'mine_count': self.grid.mine_count(),
+        }
+
+    MOVE_ACTIONS = ('reveal', 'chord', 'flag', 'unflag')
+
+    def make_moves(self, moves):
+        """
+        Make a list of (action, index) moves in order, where the action is one
+        of `MOVE_ACTIONS`, stopping early if the game ends. Returns the number
+        of moves made, the new state of every square that changed, and the
+        incorrect flags if the game was lost. Call `save_state` to persist
+        the moves
+        """
+        grid = self.grid
+        changed = set()
+        incorrect_flags = []
+        applied = 0
+
+        for action, index in moves:
+            if self.status != 'O':
+                break
+            applied += 1
+
+            result = self._move(action, index)
+            if action in ('reveal', 'chord'):
+                revealed, unflagged_mines, incorrect_flags = result
+                changed.update(revealed)
+                changed.update(unflagged_mines)
+            elif result:
+                changed.add(index)
+
+        data = {
+            'applied': applied,
+            'game_status': self.status,
+            'version': self.version,
+            'mine_count': grid.mine_count(),
+            'squares': [grid.square_data(i) for i in sorted(changed)],
+        }
+        if self.status == 'L':
+            data['incorrect_flags'] = [grid.square_data(i) for i in incorrect_flags]
+        return data
+
+    @classmethod
+    def new(cls, difficulty, width=DEFAULT_SIZE, height=DEFAULT_SIZE, seed=None, lazy=None,
+            no_guess=None):
+        """
+        Generate a new Game object with a grid of the given difficulty. Passing
+        the same seed again generates the same board.
+
+        If `lazy` (by default, the LAZY_MINES setting), the board starts empty
+        and the mines are placed on the first reveal, so that it is always
+        safe. Then the same seed generates the same board for the same first
+        reveal.
+
+        If `no_guess` (by default, from the NO_GUESS setting), the board can be
+        won without guessing, see `no_guess_board`. Without `lazy`, the first
+        reveal is made in the middle of the board. This raises
+        GenerationTimeout if no such board is found in time and the fallback
+        is 'error'
+        """
+        if lazy is None:
+            lazy = getattr(settings, 'LAZY_MINES', False)
+        if no_guess is None:
+            no_guess = getattr(settings, 'NO_GUESS', {}).get('ENABLED', False)
+        probability = mine_probability(difficulty)
+
+        with transaction.atomic():
+            if lazy:
+                rng = random.Random(seed)
+                grid = Grid(
+                    width=width,
+                    height=height,
+                    mine_chance=probability,
+                    seed=rng.getrandbits(63),
+                    no_guess=no_guess,
+                )
+            else:
+                # seeded boards have to be generated to be reproducible
+                cells = None
+                if seed is None:
+                    cells = PooledBoard.claim(width, height, difficulty, no_guess)
+                if cells is None:
+                    rng = random.Random(seed)
+                    if no_guess:
+                        board = opened_no_guess_board(width, height, probability, rng)
+                    else:
+                        board = Board.generate(width, height, probability, rng)
+                    cells = bytes(board.cells)
+                grid = Grid(width=width, height=height, cells=cells, no_guess=no_guess)
+
+            grid.recount()
+            grid.save()
+            game = Game.objects.create(difficulty=difficulty, status='O', grid=grid)
+            Snapshot.objects.create(game=game, version=0, state=game.snapshot())
+            return game
+
+
+class Move(models.Model):
+    """
+    A move in the log of a game, which made the given version of it. Moves
+    are only ever added, so the log can be replayed (see `Game.at_version`)
+    """
+    ACTIONS = tuple((action, action.capitalize()) for action in Game.MOVE_ACTIONS)
+
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    version = models.PositiveIntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    index = models.PositiveIntegerField(help_text='Index of the square on the board')
+    created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'version'], name='unique_move_version'),
+        ]
+
+
+class Snapshot(models.Model):
+    """
+    The compressed state of a game at a version, from `Game.snapshot`, so
+    that old versions can be rebuilt without replaying every move
+    """
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    version = models.PositiveIntegerField()
+    state = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'version'], name='unique_snapshot_version'),
+        ]
+
+
+class PooledBoard(models.Model):
+    """
+    A board which has been generated ahead of time, waiting to be used by a
+    new game with the same dimensions and difficulty
+    """
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    difficulty = models.FloatField()
+    cells = models.BinaryField()
+    no_guess = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['width', 'height', 'difficulty', 'no_guess'])]
+
+    @classmethod
+    def buckets(cls):
+        """
+        Get the (width, height, difficulty) combinations that are kept pooled
+        """
+        return getattr(settings, 'BOARD_POOL_BUCKETS', [])
+
     @classmethod
-    def new(cls, difficulty):
-        """
-        Generate a new Game object with a grid of the given difficulty
-        """
-        grid = Grid.objects.create(width=cls.DEFAULT_SIZE, height=cls.DEFAULT_SIZE)
-
-        # make a grid of squares with random mines
-        squares = init_2d_list(
-            width=grid.width,
-            height=grid.height,
-            initializer=lambda x, y: Square(
-                x=x,
-                y=y,
-                has_mine=chance(difficulty),
-                grid=grid,
-            ),
+    def claim(cls, width, height, difficulty, no_guess=False):
+        """
+        Take a board out of the pool, returning its cells, or None if there
+        isn't one available
+        """
+        candidates = cls.objects.filter(
+            width=width, height=height, difficulty=difficulty, no_guess=no_guess,
         )
+        for pooled in candidates.order_by('id')[:3]:
+            # another request may have claimed it first
+            if cls.objects.filter(pk=pooled.pk).delete()[0]:
+                return bytes(pooled.cells)
+        return None
 
-        # calculate the number of adjacent mines for each square
-        for square in matrix_iter(squares):
-            total = 0
+    @classmethod
+    def refill(cls, depth):
+        """
+        Top up every bucket to the given number of boards. Returns the number
+        of boards that were added.
 
-            for adjacent_square in matrix_adjacent_iter(squares, square.x, square.y):
-                if adjacent_square == square:
+        The boards can be won without guessing if that is enabled in the
+        NO_GUESS setting. Then boards which aren't found in time are skipped,
+        to be added by a later refill
+        """
+        no_guess = getattr(settings, 'NO_GUESS', {}).get('ENABLED', False)
+        added = 0
+        for width, height, difficulty in cls.buckets():
+            available = cls.objects.filter(
+                width=width, height=height, difficulty=difficulty, no_guess=no_guess,
+            ).count()
+            probability = mine_probability(difficulty)
+
+            boards = []
+            for _ in range(max(depth - available, 0)):
+                if not no_guess:
+                    boards.append(Board.generate(width, height, probability))
                     continue
-                if adjacent_square.has_mine:
-                    total += 1
-            square.adjacent_mines = total
-
-        # flatten grid of squares into bulk create
-        grid.square_set.bulk_create(square for row in squares for square in row)
+                try:
+                    boards.append(
+                        opened_no_guess_board(width, height, probability, fallback='error'),
+                    )
+                except GenerationTimeout:
+                    pass
+
+            cls.objects.bulk_create(
+                cls(
+                    width=width,
+                    height=height,
+                    difficulty=difficulty,
+                    cells=bytes(board.cells),
+                    no_guess=no_guess,
+                )
+                for board in boards
+            )
+            added += len(boards)
+        return added
+
+
+class ArchivedGame(models.Model):
+    """
+    A game which is over or was abandoned, kept as one compressed state from
+    `Game.snapshot` instead of its board, move log and snapshots. It has the
+    ID the game had, and can still be viewed with `restore`
+    """
+    status = models.CharField(max_length=1, choices=Game.STATUSES)
+    state = models.BinaryField()
+    updated = models.DateTimeField(help_text='When the game was last saved')
+    archived = models.DateTimeField(default=now)
 
-        return Game.objects.create(difficulty=difficulty, status='O', grid=grid)
+    @classmethod
+    def archive(cls, game_ids):
+        """
+        Archive the games with the given IDs, deleting everything else that
+        was kept for them. Returns the number of games archived
+        """
+        with transaction.atomic():
+            games = list(
+                Game.objects.filter(pk__in=game_ids).select_related('grid').order_by('pk')
+            )
+            cls.objects.bulk_create(
+                [
+                    cls(id=game.id, status=game.status, state=game.snapshot(), updated=game.updated)
+                    for game in games
+                ],
+                ignore_conflicts=True,
+            )
+            # deleting the grids takes their games, moves and snapshots with them
+            Grid.objects.filter(pk__in=[game.grid_id for game in games]).delete()
+        return len(games)
+
+    def restore(self):
+        """
+        Load the game as it was when it was archived. It isn't saved, so it
+        can only be looked at
+        """
+        return Game.from_state(zlib.decompress(self.state))
@@ -0,0 +1,516 @@
+"""
+Work out what a player can know about the hidden cells of a board from what
+they can see of it
+
+Every revealed number gives a constraint: exactly that many of the hidden
+cells around it have mines. Constraints are simplified as cells become known,
+and whenever one constraint's cells are a subset of another's, the difference
+between them is a constraint too. That finds every cell which is safe or a
+mine for certain from the numbers alone in almost every position.
+
+Whatever is left unknown is split into components of constraints which share
+cells, which are independent of each other, and each component's solutions
+are enumerated to get exact probabilities. Components which take too long to
+enumerate get estimates instead
+"""
+import math
+import random
+import time
+from collections import defaultdict
+
+from .board import MINE, REVEALED, Board
+
+# the number of assignments tried while enumerating, across all of the
+# components of a board, before the rest are estimated instead
+MAX_STEPS = 200000
+
+# components with more cells than this are always estimated
+MAX_COMPONENT_CELLS = 500
+
+
+class _OutOfSteps(Exception):
+    """
+    Raised when enumerating a component uses up the step budget
+    """
+
+
+class GenerationTimeout(Exception):
+    """
+    Raised when no board which can be solved without guessing is found in
+    time
+    """
+
+
+class Analysis:
+    """
+    The cells of a board which are known to be safe or to be mines, and the
+    probability of every other hidden cell having a mine. Cells which don't
+    touch any revealed number (the interior) all have the same probability,
+    `interior_probability`, which is None if it can't be known
+    """
+
+    def __init__(self, safe, mines, probabilities, interior_probability, exact):
+        self.safe = safe
+        self.mines = mines
+        self.probabilities = probabilities
+        self.interior_probability = interior_probability
+        self.exact = exact
+
+    def probability(self, index):
+        """
+        Get the probability of the hidden cell at the given index having a
+        mine
+        """
+        if index in self.safe:
+            return 0.0
+        if index in self.mines:
+            return 1.0
+        return self.probabilities.get(index, self.interior_probability)
+
+
+class _Propagator:
+    """
+    A set of constraints, each a frozenset of cells mapped to the number of
+    mines among them, which is kept simplified as cells become known
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.containing = defaultdict(set)
+        self.safe = set()
+        self.mines = set()
+        self.pending = []
+        # (cell, is_mine) for every cell which became known, in order
+        self.settled = []
+
+    def add(self, cells, count):
+        """
+        Queue a constraint to be added by `run`
+        """
+        self.pending.append((cells, count))
+
+    def run(self):
+        """
+        Add the queued constraints, and any which follow from them, until
+        nothing more can be worked out
+        """
+        counts, containing, pending = self.counts, self.containing, self.pending
+        safe, mines = self.safe, self.mines
+
+        while pending:
+            cells, count = pending.pop()
+            known = [cell for cell in cells if cell in safe or cell in mines]
+            if known:
+                count -= sum(1 for cell in known if cell in mines)
+                cells = cells.difference(known)
+            if not cells or cells in counts or not 0 <= count <= len(cells):
+                continue
+
+            if count == 0 or count == len(cells):
+                self.settle(cells, count != 0)
+                continue
+
+            related = set()
+            for cell in cells:
+                related.update(containing[cell])
+            counts[cells] = count
+            for cell in cells:
+                containing[cell].add(cells)
+
+            for other in related:
+                if other < cells:
+                    pending.append((cells - other, count - counts[other]))
+                elif cells < other:
+                    pending.append((other - cells, counts[other] - count))
+
+    def settle(self, cells, is_mine):
+        """
+        Record that all of the given cells are mines or are safe, and queue
+        the constraints they were in to be simplified
+        """
+        known = self.mines if is_mine else self.safe
+        for cell in cells:
+            if cell in self.safe or cell in self.mines:
+                continue
+            known.add(cell)
+            self.settled.append((cell, is_mine))
+            for constraint in self.containing.pop(cell, ()):
+                count = self.counts.pop(constraint)
+                for other_cell in constraint:
+                    if other_cell != cell:
+                        self.containing[other_cell].discard(constraint)
+                self.pending.append((constraint, count))
+
+    def components(self):
+        """
+        Split the remaining constraints into groups which share no cells.
+        Returns a list of (cells, constraints) pairs, with the cells in an
+        order where neighbouring cells are close together
+        """
+        seen = set()
+        components = []
+        for start in self.counts:
+            if start in seen:
+                continue
+            seen.add(start)
+
+            cells = []
+            cells_seen = set()
+            constraints = []
+            queue = [start]
+            while queue:
+                constraint = queue.pop()
+                constraints.append((constraint, self.counts[constraint]))
+                for cell in sorted(constraint):
+                    if cell in cells_seen:
+                        continue
+                    cells_seen.add(cell)
+                    cells.append(cell)
+                    for other in self.containing[cell]:
+                        if other not in seen:
+                            seen.add(other)
+                            queue.append(other)
+            components.append((cells, constraints))
+        return components
+
+
+def _enumerate(cells, constraints, budget, deadline=None):
+    """
+    Count the solutions of a component by the number of mines in them.
+    Returns a tuple of ({mines: solutions}, {mines: [solutions with a mine in
+    each cell]}) and the number of steps used. Raises _OutOfSteps if the
+    component needs more than `budget` steps, or is still going at
+    `deadline` (a `time.monotonic` time)
+    """
+    position = {cell: i for i, cell in enumerate(cells)}
+    need = [count for _, count in constraints]
+    left = [len(members) for members, _ in constraints]
+    touching = [[] for _ in cells]
+    for j, (members, _) in enumerate(constraints):
+        for cell in members:
+            touching[position[cell]].append(j)
+
+    size = len(cells)
+    assignment = [0] * size
+    totals = defaultdict(int)
+    per_cell = {}
+    steps = 0
+
+    def assign(i, mines):
+        nonlocal steps
+        if i == size:
+            totals[mines] += 1
+            if mines not in per_cell:
+                per_cell[mines] = [0] * size
+            counts = per_cell[mines]
+            for k in range(size):
+                counts[k] += assignment[k]
+            return
+
+        for value in (0, 1):
+            steps += 1
+            if steps > budget:
+                raise _OutOfSteps()
+            if deadline is not None and not steps % 1024 and time.monotonic() > deadline:
+                raise _OutOfSteps()
+
+            valid = True
+            for j in touching[i]:
+                left[j] -= 1
+                need[j] -= value
+                if need[j] < 0 or need[j] > left[j]:
+                    valid = False
+            if valid:
+                assignment[i] = value
+                assign(i + 1, mines + value)
+            for j in touching[i]:
+                left[j] += 1
+                need[j] += value
+        assignment[i] = 0
+
+    assign(0, 0)
+    return (totals, per_cell), steps
+
+
+def _estimate(cells, constraints):
+    """
+    Estimate the probability of each cell of a component which was too big
+    to enumerate, from the density of mines in the constraints it's in
+    """
+    densities = defaultdict(list)
+    for members, count in constraints:
+        for cell in members:
+            densities[cell].append(count / len(members))
+    return {cell: sum(densities[cell]) / len(densities[cell]) for cell in cells}
+
+
+def _convolve(first, second):
+    """
+    Combine two {mines: weight} distributions of independent components
+    """
+    combined = defaultdict(int)
+    for a, weight_a in first.items():
+        for b, weight_b in second.items():
+            combined[a + b] += weight_a * weight_b
+    return combined
+
+
+def analyse(board, mine_chance=None, mine_total=None, max_steps=MAX_STEPS, time_limit=None):
+    """
+    Analyse what can be seen of a board (flags are ignored, since they may be
+    wrong). Probabilities depend on how the mines were placed: each cell has
+    a mine with probability `mine_chance`, or there are exactly `mine_total`
+    mines on the board, or, given neither, every consistent layout of the
+    cells next to the revealed numbers is as likely as the others. Returns
+    an `Analysis`.
+
+    With a `time_limit` in seconds, components which are still being
+    enumerated when it runs out are estimated, like those which use up
+    `max_steps`
+    """
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    cells = board.cells
+    propagator = _Propagator()
+    hidden = 0
+    revealed_mines = 0
+
+    for index, cell in enumerate(cells):
+        if not cell & REVEALED:
+            hidden += 1
+            continue
+        if cell & MINE:
+            revealed_mines += 1
+            continue
+
+        unknown = []
+        count = board.adjacent_mines(index)
+        for neighbour in board.neighbours(index):
+            if not cells[neighbour] & REVEALED:
+                unknown.append(neighbour)
+            elif cells[neighbour] & MINE:
+                count -= 1
+        if unknown:
+            propagator.add(frozenset(unknown), count)
+
+    propagator.run()
+    safe, mines = propagator.safe, propagator.mines
+
+    exact = True
+    budget = max_steps
+    solved = []
+    probabilities = {}
+    for component_cells, constraints in propagator.components():
+        try:
+            if len(component_cells) > MAX_COMPONENT_CELLS:
+                raise _OutOfSteps()
+            solution, steps = _enumerate(component_cells, constraints, budget, deadline)
+        except _OutOfSteps:
+            exact = False
+            budget = 0
+            probabilities.update(_estimate(component_cells, constraints))
+            continue
+        budget -= steps
+        solved.append((component_cells, solution))
+
+    frontier = sum(len(component_cells) for component_cells, _ in solved) + len(probabilities)
+    interior = hidden - len(safe) - len(mines) - frontier
+    remaining = None if mine_total is None else mine_total - revealed_mines - len(mines)
+
+    if remaining is not None and not exact:
+        # the estimated components can't be combined with the others
+        # exactly, so fall back to spreading the remaining mines evenly
+        unknown = frontier + interior
+        mine_chance = min(max(remaining / unknown, 0.0), 1.0) if unknown else 0.0
+        remaining = None
+
+    if remaining is not None:
+        interior_probability = _solve_total(solved, interior, remaining, probabilities)
+    else:
+        interior_probability = mine_chance
+        for component_cells, (totals, per_cell) in solved:
+            weights = _weights(totals, len(component_cells), mine_chance)
+            _distribute(component_cells, totals, per_cell, weights, probabilities)
+
+    if exact:
+        for cell, probability in probabilities.items():
+            if probability == 0.0:
+                safe.add(cell)
+            elif probability == 1.0:
+                mines.add(cell)
+        for cell in safe.union(mines):
+            probabilities.pop(cell, None)
+
+    return Analysis(safe, mines, probabilities, interior_probability, exact)
+
+
+def _weights(totals, size, mine_chance):
+    """
+    Get the weight of the solutions of a component with each number of mines,
+    when each cell has a mine with probability `mine_chance` (or with equal
+    weight if it's None)
+    """
+    if mine_chance is None or not 0 < mine_chance < 1:
+        return {mines: 1 for mines in totals}
+    ratio = mine_chance / (1 - mine_chance)
+    return {mines: ratio ** mines for mines in totals}
+
+
+def _distribute(cells, totals, per_cell, weights, probabilities):
+    """
+    Set the probability of each cell of a component from the number of
+    solutions with a mine in it, weighted by the number of mines in each
+    """
+    total = sum(weights[mines] * solutions for mines, solutions in totals.items())
+    for i, cell in enumerate(cells):
+        with_mine = sum(weights[mines] * counts[i] for mines, counts in per_cell.items())
+        probabilities[cell] = with_mine / total
+
+
+def _solve_total(solved, interior, remaining, probabilities):
+    """
+    Set the probabilities of the cells of the solved components when there
+    are exactly `remaining` mines left among them and the `interior` cells.
+    Every layout is equally likely, so a combination of component solutions
+    with `k` mines in total is weighted by the number of ways of placing the
+    other mines in the interior. Returns the interior probability
+    """
+    def ways(mines):
+        if not 0 <= remaining - mines <= interior:
+            return 0
+        return math.comb(interior, remaining - mines)
+
+    distributions = [totals for _, (totals, _) in solved]
+
+    # the combined distribution of every component before and after each one
+    before = [{0: 1}]
+    for distribution in distributions:
+        before.append(_convolve(before[-1], distribution))
+    after = [{0: 1}]
+    for distribution in reversed(distributions):
+        after.append(_convolve(after[-1], distribution))
+    after.reverse()
+
+    total = sum(weight * ways(mines) for mines, weight in before[-1].items())
+    if not total:
+        for component_cells, _ in solved:
+            probabilities.update(dict.fromkeys(component_cells, 0.0))
+        return None
+
+    for i, (component_cells, (totals, per_cell)) in enumerate(solved):
+        others = _convolve(before[i], after[i + 1])
+        weights = {
+            mines: sum(weight * ways(mines + other) for other, weight in others.items())
+            for mines in totals
+        }
+        for k, cell in enumerate(component_cells):
+            with_mine = sum(weights[mines] * counts[k] for mines, counts in per_cell.items())
+            probabilities[cell] = with_mine / total
+
+    if not interior:
+        return None
+    expected = sum(
+        weight * ways(mines) * (remaining - mines) for mines, weight in before[-1].items()
+    )
+    return expected / total / interior
+
+
+def _certain(propagator, budget, deadline=None):
+    """
+    Enumerate the components of the remaining constraints to find cells
+    which are safe or mines in every solution. Components which need more
+    than the step budget are skipped, and none are started after `deadline`.
+    Returns the safe cells, the mines and the number of steps used
+    """
+    safe, mines = [], []
+    used = 0
+    for cells, constraints in propagator.components():
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        try:
+            if len(cells) > MAX_COMPONENT_CELLS:
+                raise _OutOfSteps()
+            (totals, per_cell), steps = _enumerate(
+                cells, constraints, budget - used, deadline,
+            )
+        except _OutOfSteps:
+            continue
+        used += steps
+
+        solutions = sum(totals.values())
+        for i, cell in enumerate(cells):
+            with_mine = sum(counts[i] for counts in per_cell.values())
+            if with_mine == 0:
+                safe.append(cell)
+            elif with_mine == solutions:
+                mines.append(cell)
+    return safe, mines, used
+
+
+def solve_from(board, start, max_steps=MAX_STEPS, deadline=None):
+    """
+    Play a copy of a board from revealing the cell at `start`, only ever
+    revealing cells which are certainly safe. Returns whether every cell
+    without a mine gets revealed, so that the board can be won without
+    guessing. The constraints are kept between moves, so each reveal only
+    adds the constraints of the newly revealed cells. If it is still going at
+    `deadline` (a `time.monotonic` time), it gives up and returns False
+    """
+    board = Board(board.width, board.height, board.cells)
+    if board.has_mine(start):
+        return False
+
+    propagator = _Propagator()
+    hidden_safe = board.hidden_safe_total()
+    budget = max_steps
+    revealed = board.reveal(start)
+
+    while True:
+        hidden_safe -= len(revealed)
+        if not hidden_safe:
+            return True
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+
+        propagator.settle(revealed, False)
+        for index in revealed:
+            if not board.adjacent_mines(index):
+                continue
+            unknown = [n for n in board.neighbours(index) if not board.is_revealed(n)]
+            if unknown:
+                propagator.add(frozenset(unknown), board.adjacent_mines(index))
+
+        propagator.settled.clear()
+        propagator.run()
+        safe = [cell for cell, is_mine in propagator.settled if not is_mine]
+
+        if not safe:
+            # nothing more follows from the constraints one at a time, so try
+            # every solution of what's left
+            safe, mines, steps = _certain(propagator, budget, deadline)
+            budget -= steps
+            propagator.settle(mines, True)
+            propagator.settle(safe, False)
+            propagator.run()
+            safe = [cell for cell, is_mine in propagator.settled if not is_mine]
+
+        safe = [cell for cell in safe if not board.is_revealed(cell)]
+        if not safe:
+            return False
+        revealed = board.reveal(*safe)
+
+
+def generate_no_guess(width, height, mine_chance, start, rng=random, time_limit=1.0):
+    """
+    Make a board like `Board.generate`, which can be won from revealing the
+    cell at `start` without guessing. The cells around `start` are kept clear.
+    Random boards are tried until one works, for up to `time_limit` seconds,
+    after which GenerationTimeout is raised, even in the middle of a board
+    """
+    deadline = time.monotonic() + time_limit
+    while True:
+        board = Board(width, height)
+        board.place_random_mines(mine_chance, rng, [start, *board.neighbours(start)])
+        if solve_from(board, start, deadline=deadline):
+            return board
+        if time.monotonic() >= deadline:
+            raise GenerationTimeout()
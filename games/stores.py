@@ -0,0 +1,287 @@
+"""
+Stores which let the workers serving the game share their cached games. Each
+game is stored with its version, so a worker can cheaply check whether its
+own copy of a game is out of date, and a new version can be stored only if
+the stored one is the version it was made from. Games which have been deleted
+from the database are marked with a tombstone, a version which is newer than
+any real one and so is never replaced.
+
+Games are kept under a namespace for the database they came from, since the
+same ID means a different game in another database. Games which haven't
+changed for `ttl` seconds are removed, by which time they have long been
+written back to the database
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.utils.module_loading import import_string
+
+VERSION_BYTES = 8
+
+# the version of a game which has been deleted, see `bury`
+TOMBSTONE = 2 ** (8 * VERSION_BYTES) - 1
+
+# the number of locks which FileStore spreads the games over
+LOCK_STRIPES = 4096
+
+
+class FileStore:
+    """
+    Keeps each game in a file in `location`, starting with its version. Files
+    are replaced atomically, and read through mmap, so readers always see a
+    complete game. Putting `location` on a tmpfs (e.g. under /dev/shm) keeps
+    it in shared memory.
+
+    Workers take turns to change a game by locking a byte of one lock file,
+    picked by the game's ID, so no lock file is left behind for each game.
+    Such locks are held by the whole process, so the threads of a worker
+    take turns using a lock for each of those bytes too
+    """
+
+    def __init__(self, location, namespace='', ttl=None):
+        self.location = os.path.join(location, namespace)
+        self.ttl = ttl
+        os.makedirs(self.location, exist_ok=True)
+        # kept open for as long as the store, since closing it drops the locks
+        self._lock_file = open( # pylint: disable=consider-using-with
+            os.path.join(self.location, 'store.lock'), 'a',
+        )
+        self._thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._next_sweep = 0
+
+    def _path(self, game_id):
+        return os.path.join(self.location, '{}.game'.format(game_id))
+
+    def version(self, game_id):
+        """
+        Get the version of the stored game, or None if it isn't stored
+        """
+        try:
+            with open(self._path(game_id), 'rb') as file:
+                header = file.read(VERSION_BYTES)
+        except FileNotFoundError:
+            return None
+        return int.from_bytes(header, 'little')
+
+    def get(self, game_id):
+        """
+        Get a tuple of (version, state) for the stored game, or None if it
+        isn't stored
+        """
+        try:
+            with open(self._path(game_id), 'rb') as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    version = int.from_bytes(mapped[:VERSION_BYTES], 'little')
+                    return version, mapped[VERSION_BYTES:]
+        except FileNotFoundError:
+            return None
+
+    def set(self, game_id, version, state):
+        """
+        Store a version of a game, unless a newer one is stored already
+        """
+        with self._locked(game_id):
+            current = self.version(game_id)
+            if current is not None and current > version:
+                return
+            self._write(game_id, version, state)
+
+    def compare_and_set(self, game_id, expected, version, state):
+        """
+        Store a version of a game if the stored version is `expected`. Returns
+        whether it was stored. A game which isn't stored is never stored by
+        this, since it may have been deleted
+        """
+        with self._locked(game_id):
+            if self.version(game_id) != expected:
+                return False
+            self._write(game_id, version, state)
+            return True
+
+    def bury(self, game_id):
+        """
+        Replace a game with a tombstone, once it has been deleted
+        """
+        with self._locked(game_id):
+            self._write(game_id, TOMBSTONE, b'')
+
+    @contextmanager
+    def _locked(self, game_id):
+        """
+        Hold the lock for a game, so that workers take turns to change it
+        """
+        stripe = hash(game_id) % LOCK_STRIPES
+        with self._thread_locks[stripe]:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, stripe)
+
+    def _write(self, game_id, version, state):
+        """
+        Replace the stored game
+        """
+        descriptor, temporary = tempfile.mkstemp(dir=self.location)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(version.to_bytes(VERSION_BYTES, 'little'))
+                file.write(state)
+            os.replace(temporary, self._path(game_id))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def delete(self, game_id):
+        """
+        Remove a game from the store
+        """
+        try:
+            os.unlink(self._path(game_id))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """
+        Remove the games which haven't changed for `ttl` seconds. This only
+        looks through the files once in a while, so it can be called often
+        """
+        if self.ttl is None or time.monotonic() < self._next_sweep:
+            return
+        self._next_sweep = time.monotonic() + self.ttl / 4
+
+        for entry in os.scandir(self.location):
+            name, extension = os.path.splitext(entry.name)
+            if extension != '.game' or not name.isdigit():
+                continue
+            game_id = int(name)
+            with self._locked(game_id):
+                try:
+                    if time.time() - os.stat(entry.path).st_mtime > self.ttl:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+class RedisStore:
+    """
+    Keeps each game in a Redis hash. Needs the `redis` package
+    """
+
+    # only replace the game if the new version is at least the stored one,
+    # expiring it after ARGV[3] seconds unless that is 0
+    SET_SCRIPT = '''
+        local current = tonumber(redis.call('HGET', KEYS[1], 'version'))
+        if current == nil or current <= tonumber(ARGV[1]) then
+            redis.call('HSET', KEYS[1], 'version', ARGV[1], 'state', ARGV[2])
+            if tonumber(ARGV[3]) > 0 then
+                redis.call('EXPIRE', KEYS[1], ARGV[3])
+            end
+        end
+    '''
+
+    # only replace the game if the stored version is the expected one
+    COMPARE_AND_SET_SCRIPT = '''
+        local current = redis.call('HGET', KEYS[1], 'version')
+        if not current or tonumber(current) ~= tonumber(ARGV[1]) then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], 'version', ARGV[2], 'state', ARGV[3])
+        if tonumber(ARGV[4]) > 0 then
+            redis.call('EXPIRE', KEYS[1], ARGV[4])
+        end
+        return 1
+    '''
+
+    def __init__(self, location, namespace='', ttl=None, prefix='minesweeper:game:'):
+        import redis # pylint: disable=import-error
+
+        self.client = redis.Redis.from_url(location)
+        self.prefix = '{}{}:'.format(prefix, namespace) if namespace else prefix
+        self.ttl = int(ttl or 0)
+        self._set = self.client.register_script(self.SET_SCRIPT)
+        self._compare_and_set = self.client.register_script(self.COMPARE_AND_SET_SCRIPT)
+
+    def version(self, game_id):
+        """
+        Get the version of the stored game, or None if it isn't stored
+        """
+        version = self.client.hget(self.prefix + str(game_id), 'version')
+        return None if version is None else int(version)
+
+    def get(self, game_id):
+        """
+        Get a tuple of (version, state) for the stored game, or None if it
+        isn't stored
+        """
+        version, state = self.client.hmget(self.prefix + str(game_id), 'version', 'state')
+        if version is None or state is None:
+            return None
+        return int(version), state
+
+    def set(self, game_id, version, state):
+        """
+        Store a version of a game, unless a newer one is stored already
+        """
+        self._set(keys=[self.prefix + str(game_id)], args=[version, state, self.ttl])
+
+    def compare_and_set(self, game_id, expected, version, state):
+        """
+        Store a version of a game if the stored version is `expected`, like
+        `FileStore.compare_and_set`. Returns whether it was stored
+        """
+        return bool(self._compare_and_set(
+            keys=[self.prefix + str(game_id)], args=[expected, version, state, self.ttl],
+        ))
+
+    def bury(self, game_id):
+        """
+        Replace a game with a tombstone, once it has been deleted
+        """
+        key = self.prefix + str(game_id)
+        pipeline = self.client.pipeline()
+        pipeline.hset(key, mapping={'version': TOMBSTONE, 'state': b''})
+        if self.ttl:
+            pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def delete(self, game_id):
+        """
+        Remove a game from the store
+        """
+        self.client.delete(self.prefix + str(game_id))
+
+    def sweep(self):
+        """
+        Does nothing, since Redis expires the games by itself
+        """
+
+
+def database_namespace(database):
+    """
+    Get a short name for a database from its entry in DATABASES, to keep the
+    games of different databases apart in a store
+    """
+    key = '|'.join(str(database.get(name, '')) for name in ('ENGINE', 'HOST', 'PORT', 'NAME'))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def get_store(config, namespace=''):
+    """
+    Make the store described by a dict with the dotted path to its class in
+    'BACKEND', where it keeps games in 'LOCATION', and how many seconds games
+    which haven't changed are kept for in 'TTL' (forever if missing). Games
+    are kept apart from those in other namespaces. Returns None if there is
+    no backend
+    """
+    if not config or not config.get('BACKEND'):
+        return None
+    return import_string(config['BACKEND'])(
+        config['LOCATION'], namespace=namespace, ttl=config.get('TTL'),
+    )
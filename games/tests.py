@@ -1,3 +1,651 @@
-from django.test import TestCase
+"""
+Tests for the board, the packing of boards into grids, replaying games and
+the solver
+"""
+import io
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .board import FLAG, MINE, REVEALED, Board
+from .cache import GameCache, GameLocks, MoveConflict, games_cache
+from .models import ArchivedGame, Game, Grid
+from .solver import analyse
+from .stores import FileStore
+from .views import retry_conflicts
+from .world import World
+
+
+def board_with_mines(width, height, *mines):
+    """
+    Make a board with mines at the given (x, y) positions
+    """
+    layout = bytearray(width * height)
+    for x, y in mines:
+        layout[y * width + x] = 1
+    board = Board(width, height)
+    board.place_mines(bytes(layout))
+    return board
+
+
+class BoardTests(TestCase):
+    """
+    Tests for `games.board.Board`
+    """
+
+    def test_adjacent_mines(self):
+        board = board_with_mines(4, 3, (0, 0), (2, 1))
+        counts = [[board.adjacent_mines(board.index(x, y)) for x in range(4)] for y in range(3)]
+        self.assertEqual(counts, [
+            [0, 2, 1, 1],
+            [1, 2, 0, 1],
+            [0, 1, 1, 1],
+        ])
+
+    def test_adjacent_mines_do_not_wrap_around_rows(self):
+        board = board_with_mines(3, 3, (2, 0))
+        self.assertEqual(board.adjacent_mines(board.index(0, 1)), 0)
+        self.assertEqual(board.adjacent_mines(board.index(1, 1)), 1)
+
+    def test_neighbours(self):
+        board = Board(3, 3)
+        self.assertEqual(sorted(board.neighbours(board.index(0, 0))), [1, 3, 4])
+        self.assertEqual(len(board.neighbours(board.index(1, 1))), 8)
+
+    def test_reveal_floods_blank_cells(self):
+        board = board_with_mines(4, 4, (3, 3))
+        revealed = board.reveal(board.index(0, 0))
+        self.assertEqual(len(revealed), 15)
+        self.assertFalse(board.is_revealed(board.index(3, 3)))
+        self.assertEqual(board.reveal(board.index(0, 0)), [])
+
+    def test_reveal_stops_at_numbers(self):
+        board = board_with_mines(4, 1, (3, 0))
+        self.assertEqual(sorted(board.reveal(0)), [0, 1, 2])
+        self.assertEqual(board.reveal(2), [])
+        self.assertEqual(board.to_string(), '001.')
+
+    def test_counters(self):
+        board = board_with_mines(3, 3, (0, 0), (2, 2))
+        board.set_flag(board.index(0, 0), True)
+        board.set_flag(board.index(1, 0), True)
+        self.assertEqual(board.mine_total(), 2)
+        self.assertEqual(board.flag_total(), 2)
+        self.assertEqual(board.hidden_safe_total(), 7)
+
+        board.reveal(board.index(1, 1))
+        self.assertEqual(board.hidden_safe_total(), 6)
+
+    def test_chord_ignores_revealed_flags(self):
+        board = board_with_mines(3, 3, (0, 0))
+        board.cells[board.index(1, 0)] |= FLAG | REVEALED
+        board.reveal(board.index(1, 1))
+        self.assertEqual(board.chord_targets(board.index(1, 1)), [])
+
+        board.set_flag(board.index(0, 0), True)
+        self.assertEqual(len(board.chord_targets(board.index(1, 1))), 6)
+
+    def test_revealed_cells_cannot_be_flagged(self):
+        board = board_with_mines(3, 3, (0, 0))
+        board.reveal(board.index(1, 1))
+        self.assertFalse(board.set_flag(board.index(1, 1), True))
+
+
+class GridCountersTests(TestCase):
+    """
+    Tests that a grid's counters are kept in step with its board by moves
+    """
+
+    def test_moves_keep_counters(self):
+        game = Game.new(5, width=8, height=8, seed=1, lazy=True)
+        game.reveal(0)
+        game.flag(63, True)
+        game.flag(62, True)
+        game.flag(62, False)
+        self.assertEqual(
+            {name: getattr(game.grid, name) for name in game.grid.COUNTERS},
+            game.grid.count(),
+        )
+
+    def test_repair_forgets_cached_games(self):
+        game = Game.new(1, width=5, height=5, seed=1, lazy=True)
+        Grid.objects.filter(pk=game.grid_id).update(flags=3)
+        games_cache.get(game.id)
+        self.assertIsNotNone(games_cache.store.get(game.id))
+
+        call_command('check_board_counters', '--repair', stdout=io.StringIO())
+        self.assertEqual(Grid.objects.get(pk=game.grid_id).flags, 0)
+        self.assertIsNone(games_cache.store.get(game.id))
+        self.assertEqual(games_cache.get(game.id).grid.flags, 0)
+
+
+
+class PackSquaresMigrationTests(TransactionTestCase):
+    """
+    Tests for packing the squares of existing grids into `Grid.cells`
+    """
+    migrate_from = [('games', '0008_square_adjacent_mines')]
+    migrate_to = [('games', '0009_grid_cells')]
+
+    def migrate(self, targets):
+        """
+        Migrate the test database, returning the models as of the targets
+        """
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_pack_squares(self):
+        apps = self.migrate(self.migrate_from)
+        Grid = apps.get_model('games', 'Grid')
+        Square = apps.get_model('games', 'Square')
+        grid = Grid.objects.create(width=2, height=2)
+        Square.objects.bulk_create([
+            Square(grid=grid, x=0, y=0, has_mine=True, has_flag=True,
+                   is_revealed=False, adjacent_mines=0),
+            Square(grid=grid, x=1, y=0, has_mine=False, has_flag=False,
+                   is_revealed=True, adjacent_mines=1),
+            Square(grid=grid, x=0, y=1, has_mine=False, has_flag=False,
+                   is_revealed=False, adjacent_mines=1),
+            Square(grid=grid, x=1, y=1, has_mine=False, has_flag=True,
+                   is_revealed=False, adjacent_mines=1),
+        ])
+
+        apps = self.migrate(self.migrate_to)
+        cells = bytes(apps.get_model('games', 'Grid').objects.get(pk=grid.pk).cells)
+        self.assertEqual(cells, bytes([MINE | FLAG, REVEALED | 0x10, 0x10, FLAG | 0x10]))
+
+
+@override_settings(SNAPSHOT_INTERVAL=3)
+class AtVersionTests(TestCase):
+    """
+    Tests for rebuilding earlier versions of a game with `Game.at_version`
+    """
+
+    def test_replays_moves(self):
+        game = Game.new(5, width=8, height=8, seed=2, lazy=True)
+        boards = [game.grid.board.to_string()]
+        for action, index in [('flag', 63), ('reveal', 0), ('flag', 62), ('unflag', 63),
+                              ('flag', 61), ('flag', 60), ('unflag', 62)]:
+            game.make_moves([(action, index)])
+            boards.append(game.grid.board.to_string())
+
+        # before and after the moves are saved
+        for _ in range(2):
+            for version, board in enumerate(boards):
+                self.assertEqual(game.at_version(version).grid.board.to_string(), board)
+            game.save_state()
+            game = Game.objects.get(pk=game.pk)
+
+        self.assertIsNone(game.at_version(len(boards)))
+        self.assertIsNone(game.at_version(-1))
+
+
+def brute_force(board, mine_chance=None, mine_total=None):
+    """
+    Get the probability of each hidden cell having a mine by trying every
+    layout of mines in the hidden cells which agrees with the revealed
+    numbers, weighted like `analyse`
+    """
+    hidden = [index for index in range(len(board)) if not board.is_revealed(index)]
+    shown_mines = sum(1 for index in range(len(board)) if board.is_revealed(index)
+                      and board.has_mine(index))
+    numbers = [
+        index for index in range(len(board))
+        if board.is_revealed(index) and not board.has_mine(index)
+    ]
+
+    total = 0.0
+    with_mine = dict.fromkeys(hidden, 0.0)
+    for layout in itertools.product((False, True), repeat=len(hidden)):
+        mines = {index for index, is_mine in zip(hidden, layout) if is_mine}
+        mines.update(index for index in range(len(board))
+                     if board.is_revealed(index) and board.has_mine(index))
+        if any(
+                sum(1 for adjacent in board.neighbours(index) if adjacent in mines)
+                != board.adjacent_mines(index)
+                for index in numbers
+        ):
+            continue
+
+        count = len(mines) - shown_mines
+        if mine_total is not None:
+            if len(mines) != mine_total:
+                continue
+            weight = 1.0
+        else:
+            weight = mine_chance ** count * (1 - mine_chance) ** (len(hidden) - count)
+        total += weight
+        for index in mines:
+            if index in with_mine:
+                with_mine[index] += weight
+    return {index: weight / total for index, weight in with_mine.items()}
+
+
+class AnalyseTests(TestCase):
+    """
+    Tests that `games.solver.analyse` agrees with trying every layout on
+    boards which are small enough to do so
+    """
+
+    def boards(self):
+        """
+        Generate partly revealed boards with at most 12 hidden cells
+        """
+        rng = random.Random(0)
+        made = 0
+        while made < 40:
+            width, height = rng.choice([(4, 4), (5, 3), (4, 5)])
+            board = Board.generate(width, height, rng.uniform(0.15, 0.4), rng)
+            safe = [index for index in range(len(board)) if not board.has_mine(index)]
+            if not safe:
+                continue
+            board.reveal(*rng.sample(safe, min(len(safe), rng.randint(1, 4))))
+            hidden = sum(1 for index in range(len(board)) if not board.is_revealed(index))
+            if not 0 < hidden <= 12:
+                continue
+            made += 1
+            yield board
+
+    def assert_matches(self, analysis, expected):
+        for index, probability in expected.items():
+            self.assertAlmostEqual(analysis.probability(index), probability, places=9)
+
+    def test_mine_chance(self):
+        for board in self.boards():
+            for mine_chance in (0.2, 0.5):
+                with self.subTest(board=board.to_string(), mine_chance=mine_chance):
+                    analysis = analyse(board, mine_chance=mine_chance)
+                    self.assertTrue(analysis.exact)
+                    self.assert_matches(analysis, brute_force(board, mine_chance=mine_chance))
+
+    def test_mine_total(self):
+        for board in self.boards():
+            with self.subTest(board=board.to_string()):
+                analysis = analyse(board, mine_total=board.mine_total())
+                self.assertTrue(analysis.exact)
+                self.assert_matches(analysis, brute_force(board, mine_total=board.mine_total()))
+
+
+class FileStoreTests(TestCase):
+    """
+    Tests for `games.stores.FileStore`
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def test_compare_and_set(self):
+        store = FileStore(self.location)
+        self.assertFalse(store.compare_and_set(1, 0, 1, b'a'))
+        self.assertIsNone(store.get(1))
+
+        store.set(1, 2, b'b')
+        store.set(1, 1, b'old')
+        self.assertEqual(store.get(1), (2, b'b'))
+        self.assertFalse(store.compare_and_set(1, 1, 3, b'c'))
+        self.assertTrue(store.compare_and_set(1, 2, 3, b'c'))
+        self.assertEqual(store.get(1), (3, b'c'))
+
+    def test_namespaces(self):
+        first = FileStore(self.location, namespace='first')
+        second = FileStore(self.location, namespace='second')
+        first.set(1, 1, b'a')
+        self.assertIsNone(second.get(1))
+
+    def test_sweep(self):
+        store = FileStore(self.location, ttl=60)
+        store.set(1, 1, b'a')
+        store.set(2, 1, b'b')
+        old = time.time() - 120
+        os.utime(store._path(1), (old, old))
+
+        store.sweep()
+        self.assertIsNone(store.get(1))
+        self.assertEqual(store.get(2), (1, b'b'))
+        self.assertEqual(
+            sorted(os.listdir(store.location)), ['2.game', 'store.lock'],
+        )
+
+    def test_new_game_clears_old_entry(self):
+        store = FileStore(self.location)
+        last = Game.objects.order_by('-id').first()
+        next_id = 1 if last is None else last.id + 1
+        store.set(next_id, 4, b'left over from another database')
+
+        with mock.patch.object(games_cache, 'store', store):
+            game = Game.new(1, width=5, height=5, seed=1, lazy=True)
+            self.assertEqual(game.id, next_id)
+            self.assertIsNone(store.get(game.id))
+            self.assertEqual(games_cache.get(game.id).version, 0)
+
+
+class GameLocksTests(TestCase):
+    """
+    Tests for `games.cache.GameLocks`
+    """
+
+    def test_locks_are_per_game(self):
+        locks = GameLocks()
+        acquired = []
+        with locks.hold(1):
+            thread = threading.Thread(
+                target=lambda: acquired.extend([locks.try_acquire(1), locks.try_acquire(2)]),
+            )
+            thread.start()
+            thread.join()
+        self.assertEqual(acquired, [False, True])
+        locks.release(2)
+        self.assertEqual(locks._locks, {})
+
+
+class GameCacheTests(TestCase):
+    """
+    Tests for `games.cache.GameCache`, with two caches sharing a store like
+    two workers
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = FileStore(directory.name)
+        self.game = Game.new(1, width=5, height=5, seed=1, lazy=True)
+
+    def cache(self, max_squares=10 ** 6, flush_interval=3600):
+        return GameCache(max_squares, flush_interval, self.store)
+
+    def test_get_gives_copies(self):
+        cache = self.cache()
+        game = cache.get(self.game.id)
+        game.version = 10
+        self.assertEqual(cache.get(self.game.id).version, 0)
+
+    def test_moves_are_shared(self):
+        first, second = self.cache(), self.cache()
+        self.assertEqual(second.get(self.game.id).version, 0)
+        with first.checkout(self.game.id) as game:
+            game.flag(0, True)
+
+        self.assertEqual(second.get(self.game.id).version, 1)
+        self.assertEqual(second.stats()['stale'], 1)
+
+    def test_conflicting_move_is_thrown_away(self):
+        first, second = self.cache(), self.cache()
+        with self.assertRaises(MoveConflict):
+            with second.checkout(self.game.id) as game:
+                with first.checkout(self.game.id) as other:
+                    other.flag(0, True)
+                game.flag(1, True)
+
+        game = second.get(self.game.id)
+        self.assertEqual(game.version, 1)
+        self.assertTrue(game.grid.board.has_flag(0))
+        self.assertFalse(game.grid.board.has_flag(1))
+
+    def test_eviction_saves_games(self):
+        other = Game.new(1, width=5, height=5, seed=2, lazy=True)
+        cache = self.cache(max_squares=30)
+        with cache.checkout(self.game.id) as game:
+            game.flag(0, True)
+        self.assertEqual(Game.objects.get(pk=self.game.id).version, 0)
+
+        cache.get(other.id)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['games'], 1)
+        self.assertEqual(Game.objects.get(pk=self.game.id).version, 1)
+
+
+class RetryConflictsTests(TestCase):
+    """
+    Tests for the `retry_conflicts` view decorator
+    """
+
+    def view(self, conflicts):
+        calls = []
+
+        @retry_conflicts
+        def view():
+            calls.append(None)
+            if len(calls) <= conflicts:
+                raise MoveConflict()
+            return HttpResponse()
+        return view, calls
+
+    @override_settings(GAME_CACHE={'MOVE_RETRIES': 2})
+    def test_retries(self):
+        view, calls = self.view(2)
+        self.assertEqual(view().status_code, 200)
+        self.assertEqual(len(calls), 3)
+
+        view, calls = self.view(3)
+        self.assertEqual(view().status_code, 409)
+        self.assertEqual(len(calls), 3)
+
+
+class ChordResultTests(TestCase):
+    """
+    Tests for the result of a chord which hits a mine
+    """
+
+    def test_failed_chord_sends_revealed_squares(self):
+        game = Game.new(1, width=3, height=3, seed=1, lazy=True)
+        grid = game.grid
+        grid.board.place_mines(bytes([0, 0, 1, 0, 0, 0, 0, 0, 0]))
+        grid.mine_chance = None
+        grid.recount()
+        game.reveal(4)
+        # the flag is on the wrong square, so the chord hits the mine
+        game.flag(0, True)
+
+        result = game.chord(4)
+        self.assertEqual(result['result'], 'fail')
+        # the blank squares on the left flood into the wrongly flagged one
+        revealed = {(square['x'], square['y']) for square in result['data']['revealed']}
+        self.assertEqual(revealed, {(x, y) for x in range(3) for y in range(3)} - {(1, 1)})
+
+
+class WorldTests(TestCase):
+    """
+    Tests for `games.world.World`
+    """
+
+    def test_capped_reveal_is_compact(self):
+        world = World(1, 0.0)
+        revealed = world.reveal((0, 0), limit=81)
+        self.assertGreaterEqual(len(revealed), 81)
+        self.assertLessEqual(max(max(abs(x), abs(y)) for x, y in revealed), 5)
+        self.assertTrue(all(
+            world.cell(x, y) & REVEALED for x in range(-4, 5) for y in range(-4, 5)
+        ))
+
+
+class ViewTestCase(TransactionTestCase):
+    """
+    Base class for tests of the API views, with moves saved as they are made.
+    The views run in the executor's threads, which have their own database
+    connections, so each test's data has to be committed
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(games_cache, 'flush_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.game = Game.new(1, width=5, height=4, seed=1, lazy=True)
+
+    def post_json(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+
+class GameMovesViewTests(ViewTestCase):
+    """
+    Tests for making several moves at once on /api/games/<id>/moves
+    """
+
+    def test_moves(self):
+        path = '/api/games/{}/moves'.format(self.game.id)
+        response = self.post_json(path, {'moves': [
+            {'action': 'flag', 'x': 4, 'y': 3},
+            {'action': 'flag', 'x': 3, 'y': 3},
+            {'action': 'unflag', 'x': 3, 'y': 3},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['applied'], data['version']), (3, 3))
+        self.assertEqual(
+            [(square['x'], square['y'], square['has_flag']) for square in data['squares']],
+            [(3, 3, False), (4, 3, True)],
+        )
+
+    def test_invalid_moves(self):
+        path = '/api/games/{}/moves'.format(self.game.id)
+        for move in [
+                {'action': 'explode', 'x': 0, 'y': 0},
+                {'action': 'flag', 'x': 5, 'y': 0},
+                {'action': 'flag', 'x': '1', 'y': 0},
+                {'action': 'flag', 'x': True, 'y': 0},
+                {'action': 'flag', 'x': 0},
+        ]:
+            with self.subTest(move=move):
+                self.assertEqual(self.post_json(path, {'moves': [move]}).status_code, 400)
+        self.assertEqual(Game.objects.get(pk=self.game.id).version, 0)
+
+
+class GameIndexViewTests(ViewTestCase):
+    """
+    Tests for making games on /api/games
+    """
+
+    def test_seeded_games_are_the_same(self):
+        boards = []
+        for _ in range(2):
+            response = self.post_json('/api/games', {
+                'difficulty': 1, 'width': 6, 'height': 6, 'seed': 5, 'lazy': False,
+            })
+            self.assertEqual(response.status_code, 200)
+            boards.append(bytes(Game.objects.get(pk=response.json()['id']).grid.cells))
+        self.assertEqual(boards[0], boards[1])
+
+    def test_invalid_games(self):
+        for data in [
+                {'difficulty': 1, 'seed': [1]},
+                {'difficulty': 1, 'seed': {'a': 1}},
+                {'difficulty': 1, 'seed': True},
+                {'difficulty': 1, 'width': True},
+                {'difficulty': 1, 'width': 0},
+                {'difficulty': 1, 'lazy': 'yes'},
+        ]:
+            with self.subTest(data=data):
+                self.assertEqual(self.post_json('/api/games', data).status_code, 400)
+        response = self.post_json('/api/infinite', {'difficulty': 1, 'seed': [1]})
+        self.assertEqual(response.status_code, 400)
+
+
+class GameViewTests(ViewTestCase):
+    """
+    Tests for getting a game on /api/games/<id>
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.path = '/api/games/{}'.format(self.game.id)
+        # version 1 has a flag at (0, 0), and version 2 another at (1, 0)
+        for x in range(2):
+            self.client.post('{}/cells/{}/0/flag'.format(self.path, x))
+
+    def get_json(self, path, **headers):
+        response = self.client.get(path, **headers)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return response, json.loads(b''.join(response.streaming_content))
+        return response, response.json()
+
+    def test_etag(self):
+        response, data = self.get_json(self.path)
+        self.assertEqual(data['version'], 2)
+        etag = response['ETag']
+
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # other query strings are other representations
+        response, _ = self.get_json(self.path + '?format=packed', HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.client.delete(self.path + '/cells/0/0/flag')
+        self.get_json(self.path, HTTP_IF_NONE_MATCH=etag)
+
+    def test_since(self):
+        _, data = self.get_json(self.path + '?since=1')
+        self.assertEqual(data['since'], 1)
+        self.assertEqual(
+            [(square['x'], square['y']) for square in data['grid']['squares']], [(1, 0)],
+        )
+        _, data = self.get_json(self.path + '?since=2')
+        self.assertEqual(data['grid']['squares'], [])
+        self.assertEqual(self.client.get(self.path + '?since=soon').status_code, 400)
+
+    def test_formats(self):
+        _, data = self.get_json(self.path + '?format=packed')
+        self.assertEqual(data['grid']['cells'], 'FF' + '.' * 18)
+        _, data = self.get_json(self.path + '?format=rle')
+        self.assertEqual(data['grid']['cells'], 'FF.{18}')
+        _, data = self.get_json(self.path)
+        self.assertEqual(len(data['grid']['squares']), 20)
+        self.assertEqual(self.client.get(self.path + '?format=xml').status_code, 400)
+
+    def test_region(self):
+        _, data = self.get_json(self.path + '?format=packed&x0=1&y0=0&x1=3&y1=2')
+        self.assertEqual(data['grid']['region'], {'x0': 1, 'y0': 0, 'x1': 3, 'y1': 2})
+        self.assertEqual(data['grid']['cells'], 'F...')
+
+        # missing bounds are the edges of the board
+        _, data = self.get_json(self.path + '?format=packed&y0=3')
+        self.assertEqual(data['grid']['region'], {'x0': 0, 'y0': 3, 'x1': 5, 'y1': 4})
+
+        for query in ['x0=3&x1=3', 'x1=6', 'x0=-1', 'y0=a', 'x0=1&since=1']:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(self.path + '?' + query).status_code, 400)
+
+    def test_hints_are_worked_out_once_per_version(self):
+        cache.clear()
+        self.client.post(self.path + '/cells/4/3/reveal')
+        path = self.path + '/hints'
+        with mock.patch.object(Game, 'hints', autospec=True, side_effect=Game.hints) as hints:
+            response, first = self.get_json(path)
+            _, second = self.get_json(path)
+            self.assertEqual(first, second)
+            self.assertEqual(hints.call_count, 1)
+
+            self.assertEqual(
+                self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304,
+            )
+            self.client.post(self.path + '/cells/4/0/flag')
+            self.get_json(path)
+            self.assertEqual(hints.call_count, 2)
+
+    def test_archived_game(self):
+        ArchivedGame.archive([self.game.id])
+        games_cache.remove(self.game.id)
+
+        _, data = self.get_json(self.path + '?format=packed')
+        self.assertEqual((data['version'], data['grid']['cells']), (2, 'FF' + '.' * 18))
+        self.assertEqual(self.client.post(self.path + '/cells/2/0/flag').status_code, 404)
+        self.assertEqual(self.client.get('/api/games/{}'.format(self.game.id + 1)).status_code, 404)
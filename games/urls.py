@@ -2,14 +2,65 @@
 Routes for the game API
 """
 
-from django.urls import path
+from django.urls import path, register_converter
 
-from .views import GameIndexView, GameView, SquareFlagView, SquareRevealView
+from .views import (
+    CacheStatsView,
+    CellChordView,
+    CellFlagView,
+    CellRevealView,
+    GameHintsView,
+    GameHistoryView,
+    GameIndexView,
+    GameMovesView,
+    GameVersionView,
+    GameView,
+    InfiniteCellChordView,
+    InfiniteCellFlagView,
+    InfiniteCellRevealView,
+    InfiniteGameIndexView,
+    InfiniteGameView,
+)
+
+class SignedIntConverter:
+    """
+    Like the built-in `int` converter, but negative numbers are allowed too,
+    for squares on boards with no edges
+    """
+    regex = '-?[0-9]+'
+
+    def to_python(self, value):
+        return int(value)
+
+    def to_url(self, value):
+        return str(value)
+
+register_converter(SignedIntConverter, 'signed')
 
 app_name = 'games'
 urlpatterns = [
     path('games/<int:game_id>', GameView.as_view()),
+    path('games/<int:game_id>/hints', GameHintsView.as_view()),
+    path('games/<int:game_id>/history', GameHistoryView.as_view()),
+    path('games/<int:game_id>/history/<int:version>', GameVersionView.as_view()),
+    path('games/<int:game_id>/moves', GameMovesView.as_view()),
+    path('games/<int:game_id>/cells/<int:x>/<int:y>/chord', CellChordView.as_view()),
+    path('games/<int:game_id>/cells/<int:x>/<int:y>/flag', CellFlagView.as_view()),
+    path('games/<int:game_id>/cells/<int:x>/<int:y>/reveal', CellRevealView.as_view()),
     path('games', GameIndexView.as_view()),
-    path('squares/<int:square_id>/flag', SquareFlagView.as_view()),
-    path('squares/<int:square_id>/reveal', SquareRevealView.as_view()),
+    path('infinite/<int:game_id>', InfiniteGameView.as_view()),
+    path(
+        'infinite/<int:game_id>/cells/<signed:x>/<signed:y>/chord',
+        InfiniteCellChordView.as_view(),
+    ),
+    path(
+        'infinite/<int:game_id>/cells/<signed:x>/<signed:y>/flag',
+        InfiniteCellFlagView.as_view(),
+    ),
+    path(
+        'infinite/<int:game_id>/cells/<signed:x>/<signed:y>/reveal',
+        InfiniteCellRevealView.as_view(),
+    ),
+    path('infinite', InfiniteGameIndexView.as_view()),
+    path('stats/cache', CacheStatsView.as_view()),
 ]
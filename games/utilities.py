@@ -1,62 +1,60 @@
 """
 Some useful things that don't belong anywhere in particular
 """
-import random
+import re
 
-def chance(percent):
-    """
-    Get either True or False with an approximate likelihood of `percent`
-    """
-    return bool(round(random.random() * percent))
+# runs of at least this many characters are shortened by run_length_encode
+MIN_RUN = 4
+RUN_PATTERN = re.compile(r'(.)\1{%d,}' % (MIN_RUN - 1))
 
-def init_2d_list(width, height, **kwargs):
-    """
-    Make a new 2D of the given dimensions
-    """
-    list2d = []
-    initializer = kwargs.get('initializer', lambda x, y: None)
-    for y in range(height):
-        row = []
-        for x in range(width):
-            row.append(initializer(x, y))
-        list2d.append(row)
-    return list2d
+# the statuses a game can have, for both fixed size and infinite games
+GAME_STATUSES = (
+    ('W', 'Won'),
+    ('L', 'Lost'),
+    ('O', 'Ongoing'),
+)
 
-def matrix_view(matrix, min_x, min_y, max_x, max_y):
+def mine_probability(difficulty):
     """
-    get the items that are within (min_x, min_y) and (max_x, max_y) coordinates
+    Get the probability of each square having a mine for the given difficulty.
+    Squares used to get a mine if `round(random.random() * difficulty)` was
+    truthy, so the same mapping is kept for existing difficulty values
     """
-    view = []
-    for adjacent_row in matrix[min_y : max_y]:
-        row = []
-        for item in adjacent_row[min_x : max_x]:
-            row.append(item)
-        view.append(row)
-    return view
+    if difficulty <= 0:
+        return 0.0
+    return min(max(1 - 0.5 / difficulty, 0.0), 1.0)
 
-def matrix_adjacent_view(matrix, x, y, min_x=0, min_y=0):
+def is_integer(value):
     """
-    Get a view of the matrix from (x-1, y-1) to (x+1, y+1)
+    Check that a value from a JSON body is an integer. Booleans are ints in
+    Python, but not here
     """
-    return matrix_view(
-        matrix,
-        min_x=max(x-1, min_x),
-        min_y=max(y-1, min_y),
-        # 2 rather than 1 since slice is not inclusive on upper bound
-        max_x=x+2,
-        max_y=y+2,
-    )
+    return isinstance(value, int) and not isinstance(value, bool)
 
-def matrix_iter(matrix):
+def run_length_encode(text):
     """
-    Iterate through a 2d list
+    Shorten runs of the same character to the character followed by the length
+    of the run in braces (e.g. '.....' becomes '.{5}'). `text` must not
+    contain braces
     """
-    for row in matrix:
-        for item in row:
-            yield item
+    return RUN_PATTERN.sub(
+        lambda match: '%s{%d}' % (match.group(1), len(match.group(0))),
+        text,
+    )
 
-def matrix_adjacent_iter(*args, **kwargs):
-    """
-    Passes an view from `matrix_adjacent_view` to `matrix_iter`
-    """
-    return matrix_iter(matrix_adjacent_view(*args, **kwargs))
+def chunked(pieces, size):
+    """
+    Join an iterable of strings into chunks of roughly `size` characters, so
+    that many small pieces can be streamed without writing each separately
+    """
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
@@ -1,13 +1,69 @@
 """
-Views relating to the game
+Views relating to the game. Most of them are async, and do their work in
+`games.executor` so that waiting on a game doesn't hold up other requests
 """
+import functools
 import json
+import random
+import time
+from contextlib import contextmanager
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.views import View
-from django.http import JsonResponse, HttpResponseForbidden
-from django.shortcuts import get_object_or_404
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.http import parse_etags, quote_etag
+
+from .cache import MoveConflict, games_cache
+from .executor import iterate_in_executor, offload
+from .infinite import InfiniteGame
+from .models import ArchivedGame, Game, Grid
+from .solver import GenerationTimeout
+from .utilities import chunked, is_integer
+
+# approximate number of characters to send at a time when streaming a board
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# cache key for the hints for a version of a game
+HINTS_KEY = 'games:hints:{}:{}'
+
+# query parameters for the bounds of a region of squares, see `parse_region`
+REGION_BOUNDS = ('x0', 'y0', 'x1', 'y1')
+
+# seconds to wait before the first retry of a move which conflicted with a
+# move in another worker, doubling for each retry after that
+RETRY_DELAY = 0.01
+
+
+def retry_conflicts(method):
+    """
+    Decorate a view method which makes a move to run it again, after a short
+    random wait, if another worker made a move on the game first (see
+    `GameCache.checkout`). After the number of retries in the GAME_CACHE
+    setting, the response is 409 Conflict
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        retries = settings.GAME_CACHE.get('MOVE_RETRIES', 0)
+        for attempt in range(retries + 1):
+            try:
+                return method(*args, **kwargs)
+            except MoveConflict:
+                if attempt < retries:
+                    time.sleep(random.uniform(0, RETRY_DELAY * 2 ** attempt))
+        return HttpResponse(status=409)
+    return wrapper
 
-from .models import Game, Square
 
 
 class GameIndexView(View):
@@ -15,12 +71,40 @@ class GameIndexView(View):
     Class for views on /api/games/ for HTTP method dispatching
     """
 
+    @offload
     def post(self, request):
         """
-        Make a new game object and send back the ID
+        Make a new game object and send back the ID. With `lazy`, the mines
+        are placed on the first reveal, and with `no_guess`, the board can be
+        won without guessing (see `Game.new`)
         """
         data = json.loads(request.body)
-        game = Game.new(data['difficulty'])
+        width = data.get('width', Game.DEFAULT_SIZE)
+        height = data.get('height', Game.DEFAULT_SIZE)
+
+        # only allow boards which are a reasonable size
+        if not all(is_integer(n) and 0 < n <= Game.MAX_SIZE for n in (width, height)):
+            return HttpResponseBadRequest()
+
+        seed = data.get('seed')
+        if not (seed is None or is_integer(seed)):
+            return HttpResponseBadRequest()
+
+        lazy, no_guess = data.get('lazy'), data.get('no_guess')
+        if not all(value is None or isinstance(value, bool) for value in (lazy, no_guess)):
+            return HttpResponseBadRequest()
+
+        try:
+            game = Game.new(
+                data['difficulty'],
+                width=width,
+                height=height,
+                seed=seed,
+                lazy=lazy,
+                no_guess=no_guess,
+            )
+        except GenerationTimeout:
+            return HttpResponse(status=503)
         return JsonResponse({'id': game.id})
 
 class GameView(View):
@@ -28,98 +112,446 @@ class GameView(View):
     Class for views on /api/games/<id> for HTTP method dispatching
     """
 
+    @offload
     def get(self, request, game_id):
         """
-        Get the game with the given ID
+        Get the game with the given ID. The squares can be sent in a compact
+        form with `?format=packed` or `?format=rle` (see `Grid.public_data`).
+        With `?since=<version>`, only the squares which changed after that
+        version are sent.
+
+        With any of `?x0=&y0=&x1=&y1=`, only the squares with x0 <= x < x1
+        and y0 <= y < y1 are sent, where missing bounds are the edges of the
+        board. This can't be combined with `since`.
+
+        Games which have been archived can still be viewed like this.
+
+        Responses have an ETag made from the version of the game, so if the
+        game hasn't changed, requests with If-None-Match get a 304
         """
-        game = get_object_or_404(Game, pk=game_id)
-        return JsonResponse(game.public_data())
+        encoding = request.GET.get('format')
+        if encoding is not None and encoding not in Grid.ENCODINGS:
+            return HttpResponseBadRequest()
+
+        since = request.GET.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return HttpResponseBadRequest()
 
-class SquareFlagView(View):
+        try:
+            game = games_cache.get(game_id)
+        except Game.DoesNotExist:
+            game = get_archived_game(game_id)
+
+        region = None
+        if any(name in request.GET for name in REGION_BOUNDS):
+            grid = game.grid
+            try:
+                region = parse_region(request.GET, (0, 0, grid.width, grid.height))
+            except ValueError:
+                return HttpResponseBadRequest()
+            x0, y0, x1, y1 = region
+            on_board = grid.board.contains(x0, y0) and grid.board.contains(x1 - 1, y1 - 1)
+            if since is not None or not on_board:
+                return HttpResponseBadRequest()
+
+        etag = quote_etag('{}-{}'.format(game.version, request.GET.urlencode()))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        elif since is not None:
+            response = JsonResponse(game.changes_since(since))
+        elif region is not None:
+            response = JsonResponse(game.public_data(encoding, region))
+        else:
+            # stream the board, since it could be big
+            chunks = chunked(game.iter_public_json(encoding), STREAM_CHUNK_SIZE)
+            if isinstance(request, ASGIRequest):
+                chunks = iterate_in_executor(chunks)
+            response = StreamingHttpResponse(chunks, content_type='application/json')
+
+        # make browsers check the ETag before using a cached copy
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+class GameHistoryView(View):
     """
-    Class for views on /api/squares/<id>/flag
+    Class for views on /api/games/<id>/history
     """
 
-    def post(self, request, square_id):
+    @offload
+    def get(self, request, game_id):
         """
-        Add a flag to the square
+        Get the log of every move made in the game, in order
         """
-        square = get_object_or_404(Square, pk=square_id)
-
-        # do not allow updates to completed game
-        if square.grid.game.status != 'O':
-            return HttpResponseForbidden()
+        try:
+            game = games_cache.get(game_id)
+        except Game.DoesNotExist:
+            raise Http404()
 
-        square.has_flag = True
-        square.save()
         return JsonResponse({
-            'mine_count': square.grid.mine_count(),
+            'id': game.id,
+            'version': game.version,
+            'moves': game.move_history(),
         })
 
-    def delete(self, request, square_id):
+class GameVersionView(View):
+    """
+    Class for views on /api/games/<id>/history/<version>
+    """
+
+    @offload
+    def get(self, request, game_id, version):
         """
-        Remove the flag from a square
+        Get the game as it was at the given version, rebuilt from the move
+        log (see `Game.at_version`). Takes `?format` like getting the game
         """
-        square = get_object_or_404(Square, pk=square_id)
+        encoding = request.GET.get('format')
+        if encoding is not None and encoding not in Grid.ENCODINGS:
+            return HttpResponseBadRequest()
 
-        # do not allow updates to completed game
-        if square.grid.game.status != 'O':
-            return HttpResponseForbidden()
+        try:
+            game = games_cache.get(game_id)
+        except Game.DoesNotExist:
+            raise Http404()
 
-        square.has_flag = False
-        square.save()
-        return JsonResponse({
-            'mine_count': square.grid.mine_count(),
-        })
+        old_game = game.at_version(version)
+        if old_game is None:
+            raise Http404()
+        return JsonResponse(old_game.public_data(encoding))
+
+class GameHintsView(View):
+    """
+    Class for views on /api/games/<id>/hints
+    """
+
+    @offload
+    def get(self, request, game_id):
+        """
+        Get hints about the hidden squares next to the revealed ones (see
+        `Game.hints`). They are worked out at most once for each version of
+        the game, so asking again before the next move costs nothing. Large
+        boards get approximate probabilities after HINT_TIME_LIMIT seconds
+        """
+        try:
+            game = games_cache.get(game_id)
+        except Game.DoesNotExist:
+            raise Http404()
 
-class SquareRevealView(View):
+        etag = quote_etag('hints-{}'.format(game.version))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            hints = cache.get(HINTS_KEY.format(game.id, game.version))
+            if hints is None:
+                hints = game.hints(getattr(settings, 'HINT_TIME_LIMIT', None))
+                cache.set(HINTS_KEY.format(game.id, hints['version']), hints)
+            response = JsonResponse(hints)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+class CacheStatsView(View):
     """
-    Class for views on /api/squares/<id>/reveal
+    Class for views on /api/stats/cache
     """
 
-    def post(self, request, square_id):
+    def get(self, request):
+        """
+        Get the counters of this worker's game cache
+        """
+        return JsonResponse(games_cache.stats())
+
+class GameMovesView(View):
+    """
+    Class for views on /api/games/<id>/moves
+    """
+
+    MAX_MOVES = 1000
+
+    @offload
+    @retry_conflicts
+    def post(self, request, game_id):
+        """
+        Make a list of moves in order, in one go. The body is a JSON object
+        with `moves`, a list of objects with an `action` ('reveal', 'chord',
+        'flag' or 'unflag') and the `x` and `y` of the square. Moves after the end of
+        the game are ignored. Returns the number of moves made, the game
+        status, and every square that changed
+        """
+        try:
+            game = games_cache.get(game_id)
+        except Game.DoesNotExist:
+            raise Http404()
+
+        try:
+            moves = parse_moves(json.loads(request.body)['moves'], game.grid.board)
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest()
+        if len(moves) > self.MAX_MOVES:
+            return HttpResponseBadRequest()
+
+        with games_cache.checkout(game_id, check=is_ongoing) as game:
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.make_moves(moves))
+
+def parse_region(query, default):
+    """
+    Get an (x0, y0, x1, y1) region of squares from a query string, taking
+    any bounds which are missing from `default`. Raises ValueError if any of
+    them isn't a number or the region is empty
+    """
+    x0, y0, x1, y1 = (
+        int(query.get(name, bound)) for name, bound in zip(REGION_BOUNDS, default)
+    )
+    if not (x0 < x1 and y0 < y1):
+        raise ValueError('The region has no squares in it')
+    return x0, y0, x1, y1
+
+def get_archived_game(game_id):
+    """
+    Get a game which has been archived, for viewing only. Raises 404 if there
+    is no such game
+    """
+    try:
+        return ArchivedGame.objects.get(pk=game_id).restore()
+    except ArchivedGame.DoesNotExist:
+        raise Http404()
+
+def is_ongoing(game):
+    """
+    Check that a game can still be played, since updates to a completed game
+    are not allowed
+    """
+    return game.status == 'O'
+
+def parse_moves(moves, board):
+    """
+    Convert a list of moves from a request into (action, index) tuples.
+    Raises ValueError if any of them are invalid
+    """
+    parsed = []
+    for move in moves:
+        action, x, y = move['action'], move['x'], move['y']
+        if action not in Game.MOVE_ACTIONS:
+            raise ValueError('Unknown action {!r}'.format(action))
+        if not (is_integer(x) and is_integer(y) and board.contains(x, y)):
+            raise ValueError('Square ({!r}, {!r}) is not on the board'.format(x, y))
+        parsed.append((action, board.index(x, y)))
+    return parsed
+
+@contextmanager
+def checkout_cell(game_id, x, y):
+    """
+    Get a game and the index of one of its squares from the square's
+    coordinates in order to make a move. Raises 404 if the square doesn't
+    exist. The game is None if it is already over
+    """
+    def check(game):
+        if not game.grid.board.contains(x, y):
+            raise Http404()
+        return is_ongoing(game)
+
+    try:
+        with games_cache.checkout(game_id, check=check) as game:
+            index = None if game is None else game.grid.board.index(x, y)
+            yield game, index
+    except Game.DoesNotExist:
+        raise Http404()
+
+class CellFlagView(View):
+    """
+    Class for views on /api/games/<id>/cells/<x>/<y>/flag
+    """
+
+    @offload
+    @retry_conflicts
+    def post(self, request, game_id, x, y):
+        """
+        Add a flag to the square
+        """
+        with checkout_cell(game_id, x, y) as (game, index):
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.flag(index, True))
+
+    @offload
+    @retry_conflicts
+    def delete(self, request, game_id, x, y):
+        """
+        Remove the flag from a square
+        """
+        with checkout_cell(game_id, x, y) as (game, index):
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.flag(index, False))
+
+class CellRevealView(View):
+    """
+    Class for views on /api/games/<id>/cells/<x>/<y>/reveal
+    """
+
+    @offload
+    @retry_conflicts
+    def post(self, request, game_id, x, y):
         """
         Reveal a square. Returns a result object, which is either success with
         the revealed squares and game status, or failure (from a mine)
         """
-        clicked_square = get_object_or_404(Square, pk=square_id)
-        grid = clicked_square.grid
-        game = grid.game
+        with checkout_cell(game_id, x, y) as (game, index):
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.reveal(index))
 
-        # do not allow updates to completed game
-        if game.status != 'O':
-            return HttpResponseForbidden()
+class CellChordView(View):
+    """
+    Class for views on /api/games/<id>/cells/<x>/<y>/chord
+    """
 
-        clicked_square.reveal()
+    @offload
+    @retry_conflicts
+    def post(self, request, game_id, x, y):
+        """
+        Reveal all of the unflagged neighbours of a number which has as many
+        flags around it as it has adjacent mines. Returns a result object like
+        revealing a square does
+        """
+        with checkout_cell(game_id, x, y) as (game, index):
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.chord(index))
 
-        data = None
-        if clicked_square.has_mine:
-            # end the game
-            game.update_status('L')
+class InfiniteGameIndexView(View):
+    """
+    Class for views on /api/infinite
+    """
 
-            incorrect_flags = grid.square_set.filter(has_mine=False, has_flag=True)
-            unflagged_mines = grid.square_set.filter(has_mine=True, has_flag=False)
-            unflagged_mines.update(is_revealed=True)
+    @offload
+    def post(self, request):
+        """
+        Make a new game on a board with no edges, and send back the ID
+        """
+        data = json.loads(request.body)
+        seed = data.get('seed')
+        if not (seed is None or is_integer(seed)):
+            return HttpResponseBadRequest()
+        game = InfiniteGame.new(data['difficulty'], seed=seed)
+        return JsonResponse({'id': game.id})
 
-            data = {
-                'incorrect_flags': [flag.public_data() for flag in incorrect_flags],
-                'unflagged_mines': [mine.public_data() for mine in unflagged_mines],
-                'mine_count': grid.mine_count(),
-            }
-        else:
-            revealed = clicked_square.reveal_neighbours()
+class InfiniteGameView(View):
+    """
+    Class for views on /api/infinite/<id>
+    """
 
-            # check if game is won (no unrevealed squares without mine)
-            if game.is_won():
-                game.update_status('W')
+    # the window that is sent if none is asked for
+    DEFAULT_WINDOW = (-16, -16, 16, 16)
 
-            data = {
-                'revealed': [square.public_data() for square in revealed],
-                'game_status': game.status,
-                'mine_count': grid.mine_count(),
-            }
+    @offload
+    def get(self, request, game_id):
+        """
+        Get the squares with x0 <= x < x1 and y0 <= y < y1 from the
+        `?x0=&y0=&x1=&y1=` query, which can hold at most
+        `InfiniteGame.MAX_WINDOW` squares. The squares are sent as a string
+        like `?format=packed` for other games, or like `?format=rle` with
+        that format (see `InfiniteGame.window`)
+        """
+        encoding = request.GET.get('format')
+        if encoding is not None and encoding not in Grid.ENCODINGS:
+            return HttpResponseBadRequest()
 
-        return JsonResponse({
-            'result': 'fail' if clicked_square.has_mine else 'success',
-            'data': data,
-        })
+        try:
+            x0, y0, x1, y1 = parse_region(request.GET, self.DEFAULT_WINDOW)
+        except ValueError:
+            return HttpResponseBadRequest()
+        if (x1 - x0) * (y1 - y0) > InfiniteGame.MAX_WINDOW:
+            return HttpResponseBadRequest()
+
+        try:
+            game = InfiniteGame.objects.get(pk=game_id)
+        except InfiniteGame.DoesNotExist:
+            raise Http404()
+        return JsonResponse(game.window(x0, y0, x1, y1, encoding))
+
+@contextmanager
+def checkout_infinite_game(game_id):
+    """
+    Get a game on a board with no edges in order to make a move, saving it
+    afterwards. Other moves on the game wait until this one is saved. The
+    game is None if it is already over
+
+    SQLite ignores `select_for_update`, so moves in this worker also take
+    turns using the game cache's locks, which are kept apart from the IDs of
+    other games
+    """
+    with games_cache.locks.hold(('infinite', game_id)), transaction.atomic():
+        try:
+            game = InfiniteGame.objects.select_for_update().get(pk=game_id)
+        except InfiniteGame.DoesNotExist:
+            raise Http404()
+
+        if not is_ongoing(game):
+            yield None
+            return
+        yield game
+        game.save_state()
+
+class InfiniteCellFlagView(View):
+    """
+    Class for views on /api/infinite/<id>/cells/<x>/<y>/flag
+    """
+
+    @offload
+    def post(self, request, game_id, x, y):
+        """
+        Add a flag to the square
+        """
+        with checkout_infinite_game(game_id) as game:
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.flag(x, y, True))
+
+    @offload
+    def delete(self, request, game_id, x, y):
+        """
+        Remove the flag from a square
+        """
+        with checkout_infinite_game(game_id) as game:
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.flag(x, y, False))
+
+class InfiniteCellRevealView(View):
+    """
+    Class for views on /api/infinite/<id>/cells/<x>/<y>/reveal
+    """
+
+    @offload
+    def post(self, request, game_id, x, y):
+        """
+        Reveal a square. Returns a result object like revealing a square in
+        other games
+        """
+        with checkout_infinite_game(game_id) as game:
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.reveal(x, y))
+
+class InfiniteCellChordView(View):
+    """
+    Class for views on /api/infinite/<id>/cells/<x>/<y>/chord
+    """
+
+    @offload
+    def post(self, request, game_id, x, y):
+        """
+        Reveal all of the unflagged neighbours of a number which has as many
+        flags around it as it has adjacent mines
+        """
+        with checkout_infinite_game(game_id) as game:
+            if game is None:
+                return HttpResponseForbidden()
+            return JsonResponse(game.chord(x, y))
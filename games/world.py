@@ -0,0 +1,274 @@
+"""
+An unbounded board, split into square chunks which are generated the first
+time they are needed
+
+The mines in each chunk are drawn from the seed of the world and the chunk's
+coordinates, so any chunk can be made again without storing it. Only chunks
+which the player has changed need to be kept, and the adjacent mine counts
+along the edges of a chunk come from the mines of its neighbours, which are
+generated but not kept. Each chunk is a `Board`, so cells are packed the same
+way as on a fixed size board
+"""
+import random
+from collections import deque
+
+from .board import ADJACENT_SHIFT, FLAG, MINE, REVEALED, VISIBLE_CHARACTERS, Board
+
+# width and height of a chunk, in cells
+CHUNK_SIZE = 32
+
+# the most cells a single reveal can flood into. On easy worlds, blank cells
+# can go on forever, so the fill stops here and revealing any blank cell on
+# its edge carries it on
+MAX_REVEAL = 10000
+
+# what `World.window` shows for each value of a mine layout, for chunks which
+# have never been changed once the game is lost
+LAYOUT_CHARACTERS = b'.M' + b'.' * 254
+
+
+class World:
+    """
+    The chunks of an unbounded board which have been loaded or generated.
+    `load(cx, cy)` is called with the coordinates of a chunk which hasn't been
+    loaded, and returns its cells, or None if it has never been changed
+    """
+
+    def __init__(self, seed, mine_chance, chunk_size=CHUNK_SIZE, load=None):
+        self.seed = seed
+        self.mine_chance = mine_chance
+        self.chunk_size = chunk_size
+        self.load = load
+        self.chunks = {}
+        self.changed = set()
+        self._layouts = {}
+        self._stored = {}
+
+    def locate(self, x, y):
+        """
+        Get the coordinates of the chunk with the cell at (x, y), and the
+        index of the cell in that chunk
+        """
+        size = self.chunk_size
+        return (x // size, y // size), (y % size) * size + x % size
+
+    def layout(self, cx, cy):
+        """
+        Get the mine layout of a chunk, as taken by `Board.place_mines`. The
+        cells around (0, 0) never have mines, so that there is always somewhere
+        safe to start
+        """
+        key = (cx, cy)
+        if key not in self._layouts:
+            size = self.chunk_size
+            board = Board(size, size)
+            safe = [
+                index
+                for x in (-1, 0, 1)
+                for y in (-1, 0, 1)
+                for chunk, index in [self.locate(x, y)]
+                if chunk == key
+            ]
+            rng = random.Random('{}:{}:{}'.format(self.seed, cx, cy))
+            board.place_random_mines(self.mine_chance, rng, safe)
+            self._layouts[key] = board.mine_layout()
+        return self._layouts[key]
+
+    def generate(self, cx, cy):
+        """
+        Make the board for a chunk which has never been changed, with the
+        mines of the chunks around it counted along its edges
+        """
+        size = self.chunk_size
+        layouts = [self.layout(cx + dx, cy + dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+        # lay the 3x3 chunks out as one board and keep the middle one
+        area = Board(3 * size, 3 * size)
+        area.place_mines(b''.join(
+            layouts[row // size * 3 + column][row % size * size:(row % size + 1) * size]
+            for row in range(3 * size)
+            for column in range(3)
+        ))
+        return Board(size, size, b''.join(
+            area.cells[(size + row) * 3 * size + size:(size + row) * 3 * size + 2 * size]
+            for row in range(size)
+        ))
+
+    def stored(self, cx, cy):
+        """
+        Get the board for a chunk if it has been changed, loading it if
+        needed, or None otherwise
+        """
+        key = (cx, cy)
+        if key in self.chunks:
+            return self.chunks[key]
+        if key not in self._stored:
+            cells = self.load(cx, cy) if self.load is not None else None
+            if cells is not None:
+                self.chunks[key] = Board(self.chunk_size, self.chunk_size, cells)
+            self._stored[key] = cells is not None
+        return self.chunks.get(key)
+
+    def preload(self, keys, stored):
+        """
+        Take the cells of chunks which were loaded in advance, where `stored`
+        has the cells of those with the given coordinates which have been
+        changed, and the others never have been
+        """
+        for key in keys:
+            if key in self.chunks or key in self._stored:
+                continue
+            cells = stored.get(key)
+            if cells is not None:
+                self.chunks[key] = Board(self.chunk_size, self.chunk_size, cells)
+            self._stored[key] = cells is not None
+
+    def chunk(self, cx, cy):
+        """
+        Get the board for a chunk, loading or generating it if needed
+        """
+        board = self.stored(cx, cy)
+        if board is None:
+            board = self.chunks[cx, cy] = self.generate(cx, cy)
+        return board
+
+    def cell(self, x, y):
+        """
+        Get the packed cell at (x, y)
+        """
+        chunk, index = self.locate(x, y)
+        return self.chunk(*chunk).cells[index]
+
+    def _update(self, x, y, set_bits=0, clear_bits=0):
+        """
+        Change the bits of the cell at (x, y), and remember that its chunk
+        needs saving
+        """
+        chunk, index = self.locate(x, y)
+        cells = self.chunk(*chunk).cells
+        cells[index] = cells[index] & ~clear_bits | set_bits
+        self.changed.add(chunk)
+
+    def reveal(self, *coords, limit=MAX_REVEAL):
+        """
+        Reveal the cells at the given (x, y) coordinates, and any blank cells
+        around them across chunk boundaries, revealing at most `limit` cells.
+        The fill goes breadth first, so if it stops at the limit, what it has
+        revealed is a compact area around the starting cells. Blank cells
+        which are already revealed carry on the fill from where an earlier
+        reveal stopped. Returns the coordinates of all of the newly revealed
+        cells
+        """
+        revealed = []
+        queue = deque()
+        for x, y in coords:
+            cell = self.cell(x, y)
+            if not cell & REVEALED:
+                self._update(x, y, REVEALED)
+                revealed.append((x, y))
+                queue.append((x, y))
+            elif not cell & MINE and not cell >> ADJACENT_SHIFT:
+                queue.append((x, y))
+
+        while queue and len(revealed) < limit:
+            x, y = queue.popleft()
+
+            # if this isn't a blank cell, we shouldn't reveal its neighbours
+            cell = self.cell(x, y)
+            if cell & MINE or cell >> ADJACENT_SHIFT:
+                continue
+
+            for adjacent in self.neighbours(x, y):
+                if self.cell(*adjacent) & (MINE | REVEALED):
+                    continue
+                self._update(*adjacent, REVEALED)
+                revealed.append(adjacent)
+                queue.append(adjacent)
+
+        return revealed
+
+    def set_flag(self, x, y, value):
+        """
+        Add or remove the flag on the cell at (x, y). Flags can't be changed
+        on revealed cells. Returns whether the flag changed
+        """
+        cell = self.cell(x, y)
+        if cell & REVEALED or bool(cell & FLAG) == value:
+            return False
+        if value:
+            self._update(x, y, FLAG)
+        else:
+            self._update(x, y, clear_bits=FLAG)
+        return True
+
+    @staticmethod
+    def neighbours(x, y):
+        """
+        Get the coordinates of the 8 cells around (x, y)
+        """
+        return [
+            (x + dx, y + dy)
+            for dy in (-1, 0, 1)
+            for dx in (-1, 0, 1)
+            if dx or dy
+        ]
+
+    def chord_targets(self, x, y):
+        """
+        Get the cells which chording on (x, y) would reveal, like
+        `Board.chord_targets`
+        """
+        cell = self.cell(x, y)
+        count = cell >> ADJACENT_SHIFT
+        if not cell & REVEALED or cell & MINE or not count:
+            return []
+
+        neighbours = self.neighbours(x, y)
+        cells = [self.cell(*adjacent) for adjacent in neighbours]
+        if sum(1 for adjacent in cells if adjacent & (FLAG | REVEALED) == FLAG) != count:
+            return []
+        return [
+            coords for coords, adjacent in zip(neighbours, cells)
+            if not adjacent & (FLAG | REVEALED)
+        ]
+
+    def cell_data(self, x, y):
+        """
+        Get the fields of a cell that should be sent to the client, like
+        `Board.cell_data`
+        """
+        chunk, index = self.locate(x, y)
+        data = self.chunk(*chunk).cell_data(index)
+        data['x'], data['y'] = x, y
+        return data
+
+    def window(self, x0, y0, x1, y1, show_mines=False):
+        """
+        Get what the player can see of the cells with x0 <= x < x1 and
+        y0 <= y < y1, as a string like `Board.to_string`. Chunks which
+        haven't been changed are never generated, since all of their cells
+        are hidden. With `show_mines`, the mines are shown everywhere
+        """
+        size = self.chunk_size
+        rows = []
+        for y in range(y0, y1):
+            cy, row = divmod(y, size)
+            pieces = []
+            x = x0
+            while x < x1:
+                cx, start = divmod(x, size)
+                end = min(size, start + x1 - x)
+                board = self.stored(cx, cy)
+                if board is not None:
+                    cells = board.cells[row * size + start:row * size + end]
+                    if show_mines:
+                        cells = bytes(cell | REVEALED if cell & MINE else cell for cell in cells)
+                    pieces.append(cells.translate(VISIBLE_CHARACTERS))
+                elif show_mines:
+                    layout = self.layout(cx, cy)[row * size + start:row * size + end]
+                    pieces.append(layout.translate(LAYOUT_CHARACTERS))
+                else:
+                    pieces.append(b'.' * (end - start))
+                x += end - start
+            rows.append(b''.join(pieces))
+        return b''.join(rows).decode('ascii')
@@ -0,0 +1,30 @@
+"""
+ASGI config for minesweeper project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Game views are async under ASGI, so one process can serve many more players
+than with WSGI. WebSockets get live updates of games from games.live.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'minesweeper.settings')
+
+django_application = get_asgi_application()
+
+# needs the apps to be loaded
+from games.live import websocket_application # pylint: disable=wrong-import-position
+
+async def application(scope, receive, send):
+    """
+    Send WebSockets to games.live, and everything else to Django
+    """
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)